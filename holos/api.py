@@ -1,32 +1,288 @@
 import os
+import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import orjson
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from .models import ChatRequest, ChatResponse, AssistantSections
-from .simple_rag import process_chat
+from .session import create_session_store
+from .cache import ResponseCache
+from .middleware import GZipRequestMiddleware
 
 # Load environment variables from .env file in the project root
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 # Create FastAPI app instance
-app = FastAPI(title="Holos Agri Assistant")
+# (responses are encoded with orjson, which is much faster than stdlib json)
+app = FastAPI(title="Holos Agri Assistant", default_response_class=ORJSONResponse)
 
 # Allow frontend (like Streamlit) to connect to backend (CORS setup)
+# The comma-separated origins are compiled into one regex, so each
+# request's Origin header is checked with a single match.
 ##origins = os.getenv("CORS_ORIGINS", "http://localhost:8501").split(",")
-origins = os.getenv("CORS_ORIGINS", "http://172.31.23.62:8501").split(",")
+origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://172.31.23.62:8501").split(",") if o.strip()]
+origin_regex = ".*" if "*" in origins else "|".join(re.escape(o) for o in origins)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,          # Which websites can connect
+    allow_origin_regex=origin_regex,  # Which websites can connect
     allow_credentials=True,
     allow_methods=["*"],            # Allow all HTTP methods (GET, POST, etc.)
     allow_headers=["*"],            # Allow all headers
 )
 
-# Store session data
-SESSION_CTX = {}
-CHAT_HISTORY = {}
+# Compress larger responses (chat replies carry CSV/weather/source sections)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+# Accept gzip-compressed request bodies (the frontend compresses larger ones)
+app.add_middleware(GZipRequestMiddleware)
+
+# Store session data (context + short-term history).
+# Redis when REDIS_URL is set, otherwise a bounded in-process TTL cache.
+sessions = create_session_store()
+
+# Cache of complete chat results keyed by (message, context); exact repeats
+# and near-identical phrasings (embedding similarity) skip the pipeline.
+response_cache = ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+# Dedicated worker pool for the blocking RAG + LLM pipeline.
+# The chat endpoint is async and hands the heavy work to this pool,
+# so the event loop keeps accepting requests while answers are generated.
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "32"))
+chat_pool = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="holos-chat")
+
+# -------------------------------------------------------
+# Lazy pipeline loading
+# -------------------------------------------------------
+# Importing simple_rag pulls in LangChain, FAISS and pandas and builds the
+# retriever, so it is loaded on first use (inside a worker thread) rather
+# than when this module is imported.
+_rag = None
+
+
+def _load_rag():
+    global _rag
+    if _rag is None:
+        from . import simple_rag
+        _rag = simple_rag
+    return _rag
+
+
+# Set once the background warm-up below has finished loading the pipeline
+_rag_ready: Optional[asyncio.Event] = None
+_warm_task: Optional[asyncio.Task] = None
+
+
+# Build the pipeline in a worker thread as soon as the server starts, so the
+# server answers immediately and the first chat request does not pay the
+# retriever/index construction cost.
+@app.on_event("startup")
+async def _warm_pipeline():
+    global _rag_ready, _warm_task
+    _rag_ready = asyncio.Event()
+
+    async def _warm():
+        try:
+            await asyncio.get_running_loop().run_in_executor(chat_pool, _load_rag)
+        except Exception as e:
+            # Requests will retry the import and surface the error themselves
+            print(f"[WARN] Pipeline warm-up failed: {e}")
+        finally:
+            _rag_ready.set()
+
+    _warm_task = asyncio.create_task(_warm())
+
+
+def _process_chat(*args):
+    return _load_rag().process_chat(*args)
+
+
+def _process_chat_batch(requests):
+    return _load_rag().process_chat_batch(requests)
+
+
+def _stream_chat(*args):
+    return _load_rag().stream_chat(*args)
+
+# -------------------------------------------------------
+# Request micro-batching
+# -------------------------------------------------------
+# Off by default. With CHAT_BATCH_WINDOW_MS > 0, chat requests that
+# arrive within that window are grouped and sent through the pipeline
+# together. ChatOpenAI.batch still sends one request per prompt (run in
+# parallel), so this only shares the worker thread; it does not save
+# LLM calls, and every request waits up to the window first.
+BATCH_WINDOW_MS = int(os.getenv("CHAT_BATCH_WINDOW_MS", "0"))
+BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "16"))
+
+# Queue of (process_chat arguments, future awaiting the result)
+chat_queue: Optional[asyncio.Queue] = None
+_batch_task: Optional[asyncio.Task] = None
+_inflight_batches: set = set()   # keeps running batch tasks referenced
+
+
+async def _run_batch(batch: List[Tuple[tuple, asyncio.Future]]):
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(chat_pool, _process_chat_batch, [args for args, _ in batch])
+    except Exception as e:
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+        return
+
+    # Hand each waiting request its own slice of the batch output
+    for (_, fut), res in zip(batch, results):
+        if not fut.done():
+            fut.set_result(res)
+
+
+# Wait for the first queued item, then collect more until the window
+# closes or the batch is full
+async def _next_batch(queue: asyncio.Queue, window_ms: int, max_size: int) -> list:
+    loop = asyncio.get_running_loop()
+    batch = [await queue.get()]
+    deadline = loop.time() + window_ms / 1000
+    while len(batch) < max_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+async def _batch_worker():
+    while True:
+        batch = await _next_batch(chat_queue, BATCH_WINDOW_MS, BATCH_MAX_SIZE)
+
+        # Dispatch without holding up collection of the next batch
+        task = asyncio.create_task(_run_batch(batch))
+        _inflight_batches.add(task)
+        task.add_done_callback(_inflight_batches.discard)
+
+
+@app.on_event("startup")
+async def _start_batcher():
+    global chat_queue, _batch_task
+    if BATCH_WINDOW_MS > 0:
+        chat_queue = asyncio.Queue()
+        _batch_task = asyncio.create_task(_batch_worker())
+
+
+# Wait for the startup warm-up rather than building a second copy
+async def _wait_ready():
+    if _rag_ready is not None and not _rag_ready.is_set():
+        await _rag_ready.wait()
+
+
+# -------------------------------------------------------
+# Message embeddings (for the response cache)
+# -------------------------------------------------------
+# Embedding a message is a network call, so it runs in a worker thread.
+# The retriever remembers the vector, so a cache miss does not embed twice.
+# Messages arriving within EMBED_BATCH_WINDOW_MS are embedded together
+# in one request (up to EMBED_BATCH_MAX_SIZE); 0 embeds each on its own.
+EMBED_WINDOW_MS = int(os.getenv("EMBED_BATCH_WINDOW_MS", "10"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+
+# Queue of (message, future awaiting its vector)
+embed_queue: Optional[asyncio.Queue] = None
+_embed_task: Optional[asyncio.Task] = None
+
+
+def _embed_messages(messages: List[str]) -> list:
+    retriever = getattr(_load_rag().processor, "retriever", None)
+    embed = getattr(retriever, "embed_queries", None)
+    if embed is None:
+        return [None] * len(messages)
+    try:
+        return embed(messages)
+    except Exception:
+        return [None] * len(messages)  # fall back to exact matching only
+
+
+async def _run_embed_batch(batch: List[Tuple[str, asyncio.Future]]):
+    try:
+        vecs = await asyncio.get_running_loop().run_in_executor(
+            chat_pool, _embed_messages, [m for m, _ in batch]
+        )
+    except Exception:
+        vecs = [None] * len(batch)
+    for (_, fut), vec in zip(batch, vecs):
+        if not fut.done():
+            fut.set_result(vec)
+
+
+async def _embed_worker():
+    while True:
+        batch = await _next_batch(embed_queue, EMBED_WINDOW_MS, EMBED_BATCH_MAX)
+        task = asyncio.create_task(_run_embed_batch(batch))
+        _inflight_batches.add(task)
+        task.add_done_callback(_inflight_batches.discard)
+
+
+@app.on_event("startup")
+async def _start_embedder():
+    global embed_queue, _embed_task
+    if EMBED_WINDOW_MS > 0:
+        embed_queue = asyncio.Queue()
+        _embed_task = asyncio.create_task(_embed_worker())
+
+
+# Look the message up in the response cache (scoped by context and
+# conversation history); returns (hit, message vector)
+async def _cache_lookup(message: str, context: dict, history: list):
+    if embed_queue is not None:
+        fut = asyncio.get_running_loop().create_future()
+        await embed_queue.put((message, fut))
+        vec = await fut
+    else:
+        vec = (await asyncio.get_running_loop().run_in_executor(chat_pool, _embed_messages, [message]))[0]
+    return response_cache.get(message, context, vec, history), vec
+
+
+async def _answer(args: tuple) -> Any:
+    # Batched path (when the dispatcher is running)
+    if chat_queue is not None:
+        fut = asyncio.get_running_loop().create_future()
+        await chat_queue.put((args, fut))
+        return await fut
+
+    # Direct path: blocking steps run in threads, the LLM call is awaited
+    # (the pipeline is loaded by now unless the warm-up failed; then the
+    # executor path below retries the import off the event loop)
+    if _rag is not None and hasattr(_rag, "aprocess_chat"):
+        return await _rag.aprocess_chat(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chat_pool, _process_chat, *args)
+
+
+# Follow-up question for the reply (or the missing fields, if any)
+def _followup(state_out: dict) -> Optional[str]:
+    missing = state_out.get("missing") or []
+    return state_out.get("followup") or (" ".join(missing) if missing else None)
+
+
+# Save the exchange and the updated context for the session
+async def _save_turn(req: ChatRequest, state_out: dict):
+    # Save updated history (the store keeps the last exchanges)
+    await sessions.append_turn(req.session_id, req.message, state_out.get("reply", ""))
+
+    # Save updated context for the current session
+    if "context" in state_out:
+        await sessions.set_context(req.session_id, state_out["context"])
 
 
 # Root API endpoint (used to check if server is running)
@@ -39,58 +295,157 @@ def root():
         "rag_available": True
     }
 
+# Health check (cheap: no pipeline work). "ready" tells whether the
+# RAG pipeline has finished loading; the frontend calls this at startup
+# to open its connection to the backend before the first message.
+@app.get("/health")
+def health():
+    return {"status": "ok", "ready": _rag is not None}
+
 # Chat endpoint - main function for chatbot requests
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest, no_cache: bool = False):
+    await _wait_ready()
+
     # Get and merge context
-    prior = SESSION_CTX.get(req.session_id, {})
+    prior = await sessions.get_context(req.session_id)
     merged_context = {**prior, **(req.context or {})}
 
     # Process the chat message
     # --- Maintain short-term memory (conversation history) ---
-    history = CHAT_HISTORY.get(req.session_id, [])
+    history = await sessions.get_history(req.session_id)
 
-    state_out = process_chat(
-        req.message,
-        req.session_id,
-        merged_context,
-        history
-    )
+    # Serve repeated questions from the response cache (bypass with ?no_cache=1)
+    state_out, vec = None, None
+    if not no_cache:
+        state_out, vec = await _cache_lookup(req.message, merged_context, history)
 
-    # Save updated history (keep last 4 exchanges)
-    history.append({"user": req.message, "bot": state_out.get("reply", "")})
-    CHAT_HISTORY[req.session_id] = history[-4:]
+    if state_out is None:
+        # Run the pipeline (retrieval, CSV, weather, LLM) off the event loop
+        state_out = await _answer((req.message, req.session_id, merged_context, history))
+        if not state_out.get("failed"):
+            response_cache.put(req.message, merged_context, state_out, vec, history)
 
-
-    # Save updated context for the current session
-    if "context" in state_out:
-        SESSION_CTX[req.session_id] = state_out["context"]
+    await _save_turn(req, state_out)
 
     # Extract follow-up questions or missing info
-    missing = state_out.get("missing") or []
-    followup = state_out.get("followup") or (" ".join(missing) if missing else None)
+    followup = _followup(state_out)
     
     # Extract detailed response sections
     sections = state_out.get("sections") or {}
 
-    # Validate and safely create the AssistantSections object
-    try:
-        sections_obj = AssistantSections(**sections) if sections else None
-    except Exception as e:
-        # Fallback if data structure is slightly off
-        sections_obj = AssistantSections(
-            rag_insights=sections.get("rag_insights"),
-            csv_findings=sections.get("csv_findings"),
-            weather_context=sections.get("weather_context"),
-            csm_results=sections.get("csm_results"),
-            assumptions=sections.get("assumptions"),
-            sources=sections.get("sources")
-        )
-    
+    # Create the AssistantSections object. The sections come from our own
+    # pipeline, so skip field validation here; FastAPI still checks the
+    # final response against ChatResponse.
+    sections_obj = AssistantSections.model_construct(**sections) if sections else None
+
     # Return chatbot response back to frontend
-    return ChatResponse(
+    return ChatResponse.model_construct(
         session_id=req.session_id,
         reply=state_out.get("reply", ""),  # Main chatbot reply
         followup=followup,                 # Follow-up prompt if needed
         sections=sections_obj              # Detailed result sections
     )
+
+
+# -------------------------------------------------------
+# Streaming chat endpoint
+# -------------------------------------------------------
+# Same pipeline as /chat, but the reply is sent as Server-Sent Events
+# while the LLM generates it, so the user sees the first words after
+# the first token instead of after the whole answer:
+#   event: token  data: {"text": "..."}      (pieces of the reply)
+#   event: done   data: {ChatResponse fields} (full reply + sections)
+#   event: error  data: {"detail": "..."}
+# While the pipeline is still loading after a start, ": loading" comment
+# lines keep the connection alive. Tokens that arrive together are sent in one event (up to
+# CHAT_STREAM_FLUSH_TOKENS), so a fast model does not cost one write per token.
+STREAM_FLUSH_TOKENS = int(os.getenv("CHAT_STREAM_FLUSH_TOKENS", "10"))
+# Seconds between keep-alive comments while the pipeline is still loading
+# (well below the frontend's 20 s read timeout)
+STREAM_KEEPALIVE_SECONDS = 5
+
+
+def _sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, no_cache: bool = False):
+    # Everything happens inside the generator: the response headers go out
+    # as soon as it starts, so a cold start does not hold them back
+    async def events():
+        # While the pipeline is still loading, send SSE comments (ignored
+        # by clients) so the client's read timeout does not expire. The
+        # first one goes out at once: GZipMiddleware holds the headers
+        # back until the first body bytes.
+        while _rag_ready is not None and not _rag_ready.is_set():
+            yield b": loading\n\n"
+            try:
+                await asyncio.wait_for(_rag_ready.wait(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+        # Get and merge context, and load short-term memory
+        prior = await sessions.get_context(req.session_id)
+        merged_context = {**prior, **(req.context or {})}
+        history = await sessions.get_history(req.session_id)
+
+        # Serve repeated questions from the response cache (bypass with ?no_cache=1)
+        state_out, vec = None, None
+        if not no_cache:
+            state_out, vec = await _cache_lookup(req.message, merged_context, history)
+
+        if state_out is not None:
+            yield _sse("token", {"text": state_out.get("reply", "")})
+        else:
+            # Run the pipeline in a worker thread and hand its events
+            # over to the event loop through a queue
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+
+            def produce():
+                try:
+                    for ev in _stream_chat(req.message, req.session_id, merged_context, history):
+                        loop.call_soon_threadsafe(queue.put_nowait, ev)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+
+            loop.run_in_executor(chat_pool, produce)
+
+            last = None
+            while last is None:
+                parts = []
+                kind, value = await queue.get()
+                while True:
+                    if kind != "token":
+                        last = (kind, value)
+                        break
+                    parts.append(value)
+                    if len(parts) >= STREAM_FLUSH_TOKENS or queue.empty():
+                        break
+                    kind, value = queue.get_nowait()
+                if parts:
+                    yield _sse("token", {"text": "".join(parts)})
+
+            kind, state_out = last
+            if kind == "error":
+                yield _sse("error", {"detail": str(state_out)})
+                return
+            if not state_out.get("failed"):
+                response_cache.put(req.message, merged_context, state_out, vec, history)
+
+        await _save_turn(req, state_out)
+        yield _sse("done", {
+            "session_id": req.session_id,
+            "reply": state_out.get("reply", ""),
+            "followup": _followup(state_out),
+            "sections": state_out.get("sections") or None,
+        })
+
+    # Tell proxies (nginx buffers responses by default) and caches to pass
+    # each event through as soon as it is written
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
@@ -0,0 +1,215 @@
+import time, threading, hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+import numpy as np
+from cachetools import TTLCache
+
+# -------------------------------------------------------
+# Class: SemanticCache
+# -------------------------------------------------------
+# Purpose:
+# A small LRU cache keyed by embedding vectors instead of exact text.
+# A lookup returns the stored value of the most similar entry in the
+# same scope when its cosine similarity is at least `threshold`.
+#
+# Vectors are L2-normalized and kept in one preallocated matrix, so a
+# lookup is a single matrix-vector product over the cached entries.
+# Once the cache holds more than `exact_limit` entries, lookups only
+# score the entries that share a random-projection LSH bucket with the
+# query (`lsh_tables` tables of `lsh_bits` hyperplanes each), so they
+# stay sub-linear as the cache grows.
+# Safe to use from several threads.
+class SemanticCache:
+    def __init__(self, maxsize: int = 512, threshold: float = 0.95, ttl: Optional[float] = None,
+                 lsh_tables: int = 8, lsh_bits: int = 10, exact_limit: int = 256):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl                       # seconds; None keeps entries until evicted
+        self.exact_limit = exact_limit       # below this size a full scan is cheaper than LSH
+        self._lock = threading.Lock()
+        self._mat: Optional[np.ndarray] = None               # (maxsize, dim), allocated on first insert
+        # LSH index: hyperplanes (tables * bits, dim) allocated with _mat,
+        # one {bucket code: slots} dict per table, and each slot's codes
+        self._planes: Optional[np.ndarray] = None
+        self._lsh_tables = lsh_tables
+        self._bit_weights = 1 << np.arange(lsh_bits, dtype=np.int64)
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(lsh_tables)]
+        self._slot_codes = np.zeros((maxsize, lsh_tables), dtype=np.int64)
+        self._slot_scope = np.full(maxsize, -1, dtype=np.int64)   # scope id per slot, -1 = free
+        self._slot_value: List[Any] = [None] * maxsize
+        self._slot_time: List[float] = [0.0] * maxsize
+        self._free_slots: List[int] = list(range(maxsize - 1, -1, -1))
+        self._lru: "OrderedDict[int, None]" = OrderedDict()     # used slots, oldest first
+        self._scope_ids: Dict[Hashable, int] = {}
+
+    # ---------------------------------------------------
+    # Function: _normalize
+    # ---------------------------------------------------
+    # Purpose:
+    # Convert a vector to a unit-length float32 array.
+    @staticmethod
+    def _normalize(vec: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+
+    # Bucket code of `q` in every LSH table (sign pattern of its projections)
+    def _codes(self, q: np.ndarray) -> np.ndarray:
+        bits = (self._planes @ q > 0).reshape(self._lsh_tables, -1)
+        return bits.astype(np.int64) @ self._bit_weights
+
+    # ---------------------------------------------------
+    # Function: get
+    # ---------------------------------------------------
+    # Purpose:
+    # Return the cached value closest to `vec` within `scope`,
+    # or None when nothing is similar enough.
+    def get(self, scope: Hashable, vec: Sequence[float]) -> Optional[Any]:
+        q = self._normalize(vec)
+        with self._lock:
+            sid = self._scope_ids.get(scope)
+            if sid is None or not self._lru or self._mat is None or self._mat.shape[1] != q.shape[0]:
+                return None
+
+            if len(self._lru) > self.exact_limit:
+                # Candidates: entries sharing at least one LSH bucket
+                found = set()
+                for t, code in enumerate(self._codes(q).tolist()):
+                    found.update(self._buckets[t].get(code, ()))
+                slots = np.fromiter(found, dtype=np.int64, count=len(found))
+                slots = slots[self._slot_scope[slots] == sid]
+            else:
+                slots = np.flatnonzero(self._slot_scope == sid)
+            if slots.size == 0:
+                return None
+
+            scores = self._mat[slots] @ q
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            slot = int(slots[best])
+            if self.ttl is not None and time.monotonic() - self._slot_time[slot] > self.ttl:
+                self._free(slot)
+                return None
+
+            self._lru.move_to_end(slot)
+            return self._slot_value[slot]
+
+    # ---------------------------------------------------
+    # Function: put
+    # ---------------------------------------------------
+    # Purpose:
+    # Store `value` under `vec` in `scope`, evicting the least
+    # recently used entry when the cache is full.
+    def put(self, scope: Hashable, vec: Sequence[float], value: Any) -> None:
+        q = self._normalize(vec)
+        with self._lock:
+            if self._mat is None or self._mat.shape[1] != q.shape[0]:
+                # First insert (or a different embedding size): (re)allocate
+                for s in list(self._lru):
+                    self._free(s)
+                self._mat = np.zeros((self.maxsize, q.shape[0]), dtype=np.float32)
+                rng = np.random.default_rng(0)
+                self._planes = rng.standard_normal(
+                    (self._lsh_tables * len(self._bit_weights), q.shape[0])).astype(np.float32)
+
+            if not self._free_slots:
+                self._free(next(iter(self._lru)))   # evict least recently used
+            slot = self._free_slots.pop()
+
+            if scope not in self._scope_ids and len(self._scope_ids) >= 4 * self.maxsize:
+                self._compact_scopes()
+
+            self._mat[slot] = q
+            codes = self._codes(q)
+            self._slot_codes[slot] = codes
+            for t, code in enumerate(codes.tolist()):
+                self._buckets[t].setdefault(code, set()).add(slot)
+            self._slot_scope[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._slot_value[slot] = value
+            self._slot_time[slot] = time.monotonic()
+            self._lru[slot] = None
+
+    def _free(self, slot: int) -> None:
+        if slot in self._lru:
+            del self._lru[slot]
+            self._slot_scope[slot] = -1
+            self._slot_value[slot] = None
+            self._free_slots.append(slot)
+            for t, code in enumerate(self._slot_codes[slot].tolist()):
+                bucket = self._buckets[t].get(code)
+                if bucket is not None:
+                    bucket.discard(slot)
+                    if not bucket:
+                        del self._buckets[t][code]
+
+    # Drop scope ids that no cached entry uses any more
+    def _compact_scopes(self) -> None:
+        live = set(self._slot_scope[list(self._lru)].tolist())
+        remap = {}
+        for scope, sid in list(self._scope_ids.items()):
+            if sid in live:
+                remap[sid] = len(remap)
+                self._scope_ids[scope] = remap[sid]
+            else:
+                del self._scope_ids[scope]
+        for s in self._lru:
+            self._slot_scope[s] = remap[int(self._slot_scope[s])]
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+
+# -------------------------------------------------------
+# Class: ResponseCache
+# -------------------------------------------------------
+# Purpose:
+# Caches complete chat results by (message, context, history) so repeated
+# questions skip retrieval and the LLM call. The reply depends on the
+# conversation so far, so a digest of the recent history is part of
+# every key: a follow-up is only reused within the same conversation
+# state, never for another session or a later turn.
+# 1. Exact layer: normalized message text + context + history, TTL + LRU.
+# 2. Semantic layer (optional): near-identical phrasings with the same
+#    context and history, matched by query embedding (see SemanticCache).
+class ResponseCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, threshold: float = 0.95):
+        self._lock = threading.Lock()
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._semantic = SemanticCache(maxsize=min(maxsize, 512), threshold=threshold, ttl=ttl)
+
+    @staticmethod
+    def _context_key(context: Optional[Dict[str, Any]]) -> tuple:
+        return tuple(sorted((k, repr(v)) for k, v in (context or {}).items()))
+
+    @staticmethod
+    def _history_key(history: Optional[Sequence[Any]]) -> str:
+        return hashlib.sha1(repr(list(history or ())).encode()).hexdigest() if history else ""
+
+    @staticmethod
+    def _message_key(message: str) -> str:
+        return " ".join(message.lower().split())
+
+    # Scope shared by both layers: context + conversation history
+    def _scope(self, context: Optional[Dict[str, Any]], history: Optional[Sequence[Any]]) -> tuple:
+        return (self._context_key(context), self._history_key(history))
+
+    # Returns the cached value, or None on a miss.
+    # `vec` is the message embedding; pass None to use the exact layer only.
+    def get(self, message: str, context: Optional[Dict[str, Any]], vec: Optional[Sequence[float]] = None,
+            history: Optional[Sequence[Any]] = None) -> Optional[Any]:
+        scope = self._scope(context, history)
+        with self._lock:
+            hit = self._exact.get((self._message_key(message), scope))
+        if hit is not None or vec is None:
+            return hit
+        return self._semantic.get(scope, vec)
+
+    def put(self, message: str, context: Optional[Dict[str, Any]], value: Any, vec: Optional[Sequence[float]] = None,
+            history: Optional[Sequence[Any]] = None) -> None:
+        scope = self._scope(context, history)
+        with self._lock:
+            self._exact[(self._message_key(message), scope)] = value
+        if vec is not None:
+            self._semantic.put(scope, vec, value)
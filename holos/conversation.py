@@ -1,4 +1,5 @@
 from typing import Dict, Any, List, Tuple, Optional
+from itertools import combinations
 import re
 
 # -------------------------------------------------------
@@ -24,6 +25,54 @@ US_STATES = {
     'texas': 'TX',
 }
 
+# -------------------------------------------------------
+# Keywords for crop and season detection
+# -------------------------------------------------------
+# Lists are in priority order: when a message mentions several crops,
+# the one listed first wins.
+CROPS = ["rice", "wheat", "corn", "maize", "soy", "soybean", "cotton", "sorghum"]
+SPRING_WORDS = ["spring", "march", "april", "may"]
+FALL_WORDS = ["fall", "autumn", "sept", "oct"]
+
+# Rank of each crop/state in its priority list (dict lookup, not list scan)
+CROP_RANK = {c: i for i, c in enumerate(CROPS)}
+STATE_RANK = {name: i for i, name in enumerate(US_STATES)}
+
+# Context fields filled by heuristic_extract
+EXTRACTED_FIELDS = frozenset({"crop", "region", "season"})
+
+# -------------------------------------------------------
+# Keyword Pattern
+# -------------------------------------------------------
+# One compiled regex finds every crop, state and season keyword in a
+# single pass over the message. Each keyword family is a named group, so
+# a match tells us which field it belongs to. Keywords must start at a
+# word boundary ("acorn" is not corn, "doctor" is not October) but may
+# have a suffix ("soybeans", "september").
+#
+# The pattern only contains the fields that are still missing from the
+# context, so later turns (crop already known) scan for less. A pattern
+# for every combination of fields is compiled once, at import time.
+def _alternation(words) -> str:
+    return "|".join(re.escape(w) for w in words)
+
+def _build_pattern(fields: frozenset) -> "re.Pattern[str]":
+    groups = []
+    if "crop" in fields:
+        groups.append(rf"(?P<crop>{_alternation(CROPS)})")
+    if "region" in fields:
+        groups.append(rf"(?P<state>{_alternation(US_STATES)})")
+    if "season" in fields:
+        groups.append(rf"(?P<spring>{_alternation(SPRING_WORDS)})")
+        groups.append(rf"(?P<fall>{_alternation(FALL_WORDS)})")
+    return re.compile(r"\b(?:" + "|".join(groups) + r")")
+
+KEYWORD_PATTERNS: Dict[frozenset, "re.Pattern[str]"] = {
+    frozenset(fields): _build_pattern(frozenset(fields))
+    for n in range(1, len(EXTRACTED_FIELDS) + 1)
+    for fields in combinations(sorted(EXTRACTED_FIELDS), n)
+}
+
 # -------------------------------------------------------
 # Function: heuristic_extract
 # -------------------------------------------------------
@@ -32,30 +81,34 @@ US_STATES = {
 # from a user's message using simple word matching.
 def heuristic_extract(message: str, context: Dict[str, Any]) -> Dict[str, Any]:
     out = dict(context or {})   # Copy existing context to avoid overwriting
-    msg = message.lower()       # Convert message to lowercase for easy search
+
+    # Only look for fields that are not already set in context
+    wanted = frozenset(f for f in EXTRACTED_FIELDS if not out.get(f))
+    if not wanted:
+        return out
+
+    # Collect every keyword in one scan of the lowercased message, grouped by field
+    found: Dict[str, set] = {}
+    for m in KEYWORD_PATTERNS[wanted].finditer(message.lower()):
+        found.setdefault(m.lastgroup, set()).add(m.group(m.lastgroup))
 
     # --- Detect crop name ---
-    for c in ["rice", "wheat", "corn", "maize", "soy", "soybean", "cotton", "sorghum"]:
-        # If crop name appears in the message and not already set in context
-        if c in msg and not out.get("crop"):
-            out["crop"] = "rice" if c == "rice" else c
+    # Highest-priority crop wins
+    if found.get("crop"):
+        out["crop"] = min(found["crop"], key=CROP_RANK.__getitem__)
 
     # --- Detect region or state ---
-    # Prefer full state names (like "texas") over ZIP codes
-    for name, abbr in US_STATES.items():
-        if name in msg and not out.get("region"):
-            out["region"] = name.title()  # Save readable state name
-            out["state"] = abbr           # Save 2-letter abbreviation
-            break
-
-        # ZIP handling removed — we only accept state names (California or Texas)
+    # ZIP handling removed — we only accept state names (California or Texas)
+    if found.get("state"):
+        name = min(found["state"], key=STATE_RANK.__getitem__)
+        out["region"] = name.title()      # Save readable state name
+        out["state"] = US_STATES[name]    # Save 2-letter abbreviation
 
     # --- Detect season ---
-    # Identify spring months/keywords
-    if any(w in msg for w in ["spring", "march", "april", "may"]) and not out.get("season"):
+    # Spring months/keywords take precedence over fall/autumn ones
+    if "spring" in found:
         out["season"] = "spring"
-    # Identify fall/autumn months/keywords
-    if any(w in msg for w in ["fall", "autumn", "sept", "oct"]) and not out.get("season"):
+    elif "fall" in found:
         out["season"] = "fall"
 
     # Return the updated context dictionary
@@ -86,17 +139,17 @@ def find_missing(ctx: Dict[str, Any]) -> List[str]:
 #         elif not ctx.get("season"):
 #             return "Which season or target planting window are you considering?"
 #         return ""
+# Question asked for each critical field (like 'crop') when it is missing
+FOLLOWUP_PROMPTS = {
+    "crop": "Which crop are you asking about?",
+}
+
 def next_followup(missing: List[str], ctx: Dict[str, Any]) -> str:
     if not missing:
         return ""
 
-
-
     # If something critical is missing (like 'crop')
-    prompts = {
-        "crop": "Which crop are you asking about?",
-    }
-    return prompts[missing[0]]
+    return FOLLOWUP_PROMPTS[missing[0]]
 
 
 # -------------------------------------------------------
@@ -1,7 +1,41 @@
-import hashlib, json, time
-from typing import Dict, Any
+import os, time
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Tuple
 from functools import lru_cache
 
+# -------------------------------------------------------
+# Function: _cached_run
+# -------------------------------------------------------
+# Purpose:
+# A mock (temporary) simulation function that imitates
+# running a real CSM model. It is cached so that repeated
+# calls with the same key return instantly.
+# Lives at module level so the cache is shared by every CSMRunner
+# instance and does not keep instances alive.
+# The result is a read-only MappingProxyType: every cache hit returns the
+# same object, so callers must not mutate it (build a new dict instead).
+@lru_cache(maxsize=256)
+def _cached_run(key: Tuple) -> Mapping[str, Any]:
+    # Optionally simulate computation delay (as if running a real simulation),
+    # e.g. CSM_SIMULATE_LATENCY=0.3 for demos. Off by default: the stub has
+    # nothing to compute and the sleep only held a worker thread.
+    delay = float(os.getenv("CSM_SIMULATE_LATENCY") or 0)
+    if delay > 0:
+        time.sleep(delay)
+
+    # Return mock/stub results — in a real version, these would
+    # come from an actual simulation output file.
+    return MappingProxyType({
+        "sim_id": f"{hash(key) & 0xffffffff:08x}",  # Short simulation ID
+        "yield_kg_ha": 7800,                    # Example yield value
+        "planting_date": "auto",                # Auto-selected planting date
+        "maturity_date": "auto+120d",           # Simulated maturity period
+        "irrigation_mm": 900,                   # Example irrigation value
+        "ratoon_possible": True,                # Whether regrowth (ratoon) is possible
+        "notes": "Stub CSM. Plug in your model in csm_runner.py."  # Reminder
+    })
+
+
 # -------------------------------------------------------
 # Class: CSMRunner
 # -------------------------------------------------------
@@ -16,48 +50,27 @@ class CSMRunner:
         self.csm_dir = csm_dir
 
     # ---------------------------------------------------
-    # Function: _key
+    # Function: _freeze
     # ---------------------------------------------------
     # Purpose:
-    # Create a unique key (hash) from the input parameters.
-    # This allows caching of results so that the same inputs
-    # don’t need to be reprocessed each time.
-    def _key(self, params: Dict[str, Any]) -> str:
-        # Convert parameters to JSON string and hash them using SHA-256
-        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
-
-    # ---------------------------------------------------
-    # Function: _cached_run
-    # ---------------------------------------------------
-    # Purpose:
-    # A mock (temporary) simulation function that imitates
-    # running a real CSM model. It is cached so that repeated
-    # calls with the same key return instantly.
-    @lru_cache(maxsize=256)
-    def _cached_run(self, key: str) -> Dict[str, Any]:
-        # Simulate computation delay (as if running a real simulation)
-        time.sleep(0.3)
-
-        # Return mock/stub results — in a real version, these would
-        # come from an actual simulation output file.
-        return {
-            "sim_id": key[:8],                      # Short simulation ID
-            "yield_kg_ha": 7800,                    # Example yield value
-            "planting_date": "auto",                # Auto-selected planting date
-            "maturity_date": "auto+120d",           # Simulated maturity period
-            "irrigation_mm": 900,                   # Example irrigation value
-            "ratoon_possible": True,                # Whether regrowth (ratoon) is possible
-            "notes": "Stub CSM. Plug in your model in csm_runner.py."  # Reminder
-        }
+    # Turn the input parameters into a hashable key (sorted tuple of
+    # items; nested dicts and lists become tuples too) so they can be
+    # used directly as the cache key.
+    @staticmethod
+    def _freeze(value: Any) -> Any:
+        if isinstance(value, dict):
+            return tuple(sorted((k, CSMRunner._freeze(v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(CSMRunner._freeze(v) for v in value)
+        return value
 
     # ---------------------------------------------------
     # Function: run
     # ---------------------------------------------------
     # Purpose:
     # Public function that runs the model for given parameters.
-    # It generates a unique cache key and retrieves results
+    # It builds a hashable cache key and retrieves results
     # (either from cache or by calling the simulation stub).
-    def run(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        # Generate unique hash for input parameters
-        # and call the cached simulation function
-        return self._cached_run(self._key(params))
+    def run(self, params: Dict[str, Any]) -> Mapping[str, Any]:
+        # Freeze the parameters and call the cached simulation function
+        return _cached_run(self._freeze(params))
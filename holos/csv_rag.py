@@ -1,7 +1,244 @@
-import os
-from typing import Dict, Any, Optional, List
+import os, copy, threading
+from typing import Dict, Any, Optional, List, Tuple
+from functools import lru_cache
 import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+# Column names that identify a location (used for region filtering)
+REGION_COLUMNS = {"county", "region", "state", "zip", "zipcode"}
+
+# Numeric column types reported by DuckDB (DECIMAL(p,s) is matched by prefix)
+NUMERIC_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+    "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT",
+    "FLOAT", "REAL", "DOUBLE",
+}
+
+
+def _quote(name: str) -> str:
+    # Quote a column name for use as a SQL identifier
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_numeric(col_type: str) -> bool:
+    return col_type.upper() in NUMERIC_TYPES or col_type.upper().startswith("DECIMAL")
+
+
+def _as_float(v: Any) -> Optional[float]:
+    # Convert a statistic to float for JSON (None when undefined, e.g. std of one row)
+    return float(v) if v is not None else None
+
+
+# -------------------------------------------------------
+# Function: _list_csvs
+# -------------------------------------------------------
+# Purpose:
+# List the CSV files of a folder as (name, lowercase name) pairs.
+# Cached per (folder, modification time), so the folder is only listed
+# again after files are added, removed or renamed in it.
+@lru_cache(maxsize=32)
+def _list_csvs(dir_path: str, mtime_ns: int) -> Tuple[Tuple[str, str], ...]:
+    return tuple((f, f.lower()) for f in os.listdir(dir_path) if f.lower().endswith(".csv"))
+
+
+# Arrow tables of the datasets, keyed by CSV path: (CSV mtime, table)
+_PARQUET_CACHE: Dict[str, Tuple[float, pa.Table]] = {}
+_PARQUET_LOCK = threading.Lock()   # one conversion at a time (no half-written files)
+
+
+# -------------------------------------------------------
+# Function: _load_table
+# -------------------------------------------------------
+# Purpose:
+# Load a CSV dataset as an Arrow table through a Parquet copy.
+# - The first read converts <name>.csv to <name>.parquet next to it
+#   (rewritten whenever the CSV is newer than the Parquet file).
+# - Later reads use the compressed, columnar Parquet file.
+# - Tables stay in memory until the CSV changes.
+# If the data folder is read-only the table is simply kept in memory.
+# Read errors are raised (and not cached), so a fixed file is picked up
+# on the next request.
+def _load_table(path: str, mtime: float) -> pa.Table:
+    with _PARQUET_LOCK:
+        cached = _PARQUET_CACHE.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        table = _read_via_parquet(path, mtime)
+        _PARQUET_CACHE[path] = (mtime, table)
+        return table
+
+
+def _read_via_parquet(path: str, mtime: float) -> pa.Table:
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    # Reuse the copy only if it is newer than the CSV and was written from
+    # a pandas read (older copies came from a stricter CSV parser)
+    try:
+        fresh = (os.path.getmtime(parquet_path) >= mtime
+                 and b"pandas" in (pq.read_schema(parquet_path).metadata or {}))
+    except (OSError, pa.ArrowInvalid):
+        fresh = False
+
+    if fresh:
+        table = pq.read_table(parquet_path)
+    else:
+        table = _read_csv(path)
+        try:
+            pq.write_table(table, parquet_path)
+        except OSError:
+            pass  # can't write next to the CSV; keep the in-memory table only
+    return table
+
+
+# -------------------------------------------------------
+# Function: _read_csv
+# -------------------------------------------------------
+# Purpose:
+# Parse a CSV file into an Arrow table with pandas, which tolerates the
+# hand-written files in data/docs (e.g. rows with one extra, unquoted
+# field, read as the row index) and names blank headers "Unnamed: N".
+# Only runs when the Parquet copy is missing or stale.
+def _read_csv(path: str) -> pa.Table:
+    df = pd.read_csv(path)
+    # Text columns as nullable strings, so mixed values convert to Arrow
+    text_cols = df.select_dtypes("object").columns
+    df[text_cols] = df[text_cols].astype("string")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# -------------------------------------------------------
+# Function: _describe_cached
+# -------------------------------------------------------
+# Purpose:
+# Region-independent part of a dataset summary, computed with DuckDB
+# over the dataset's Arrow table (zero-copy, no DataFrame): row count,
+# column names and the statistics of every numeric column, all in one
+# vectorized scan.
+# Cached per (file path, modification time) so a new region or repeated
+# questions never recompute the statistics. Read errors are raised, so
+# they are not cached. Callers must not mutate the returned dictionary.
+@lru_cache(maxsize=64)
+def _describe_cached(path: str, mtime: float) -> Dict[str, Any]:
+    con = duckdb.connect()
+    try:
+        con.register("data", _load_table(path, mtime))
+
+        # Column names and detected types
+        schema = con.execute("DESCRIBE SELECT * FROM data").fetchall()
+        columns = [row[0] for row in schema]
+        numeric_cols = [row[0] for row in schema if _is_numeric(row[1])]
+
+        # Build a single aggregate query over the whole file
+        select = ["COUNT(*)"]
+        for c in numeric_cols:
+            q = _quote(c)
+            select.append(
+                f"COUNT({q}), AVG({q}), STDDEV_SAMP({q}), MIN({q}), "
+                f"QUANTILE_CONT({q}, [0.25, 0.5, 0.75]), MAX({q})"
+            )
+        row = con.execute(f"SELECT {', '.join(select)} FROM data").fetchone()
+    finally:
+        con.close()
+
+    # Basic dataset info
+    out: Dict[str, Any] = {
+        "dataset": os.path.basename(path),  # File name
+        "rows": int(row[0]),                # Total number of rows
+        "columns": columns                  # List of column names
+    }
+
+    # ------------------------------------------------
+    # Numeric Summary (statistics for numeric columns)
+    # ------------------------------------------------
+    # Same statistics as pandas describe(): count, mean, std, min, quartiles, max
+    if numeric_cols:
+        summary = {}
+        for n, c in enumerate(numeric_cols):
+            count, mean, std, lo, quartiles, hi = row[1 + 6 * n: 7 + 6 * n]
+            q25, q50, q75 = quartiles if quartiles else (None, None, None)
+            summary[c] = {
+                "count": float(count),
+                "mean": _as_float(mean),
+                "std": _as_float(std),
+                "min": _as_float(lo),
+                "25%": _as_float(q25),
+                "50%": _as_float(q50),
+                "75%": _as_float(q75),
+                "max": _as_float(hi),
+            }
+        out["numeric_summary"] = summary
+
+    return out
+
+
+# -------------------------------------------------------
+# Function: _lowered_location
+# -------------------------------------------------------
+# Purpose:
+# Return the dataset's location column (first of county, region,
+# state, zip, zipcode) as lowercase strings, or None if it has none.
+# Lowercased once per file version and kept as an Arrow array, so
+# region filters only run a substring match.
+@lru_cache(maxsize=16)
+def _lowered_location(path: str, mtime: float) -> Optional[pa.ChunkedArray]:
+    table = _load_table(path, mtime)
+    col = next((c for c in table.column_names if c.lower() in REGION_COLUMNS), None)
+    if not col:
+        return None
+
+    values = table.column(col)
+    if not pa.types.is_string(values.type):
+        values = pc.cast(values, pa.string())   # e.g. ZIP codes read as integers
+    return pc.utf8_lower(values)
+
+
+# -------------------------------------------------------
+# Function: _region_rows
+# -------------------------------------------------------
+# Purpose:
+# Count the rows whose location column contains the region name or
+# ZIP code (one vectorized pass over the cached lowercase column).
+# Returns None when the dataset has no location column.
+@lru_cache(maxsize=256)
+def _region_rows(path: str, mtime: float, region: str) -> Optional[int]:
+    try:
+        lowered = _lowered_location(path, mtime)
+        if lowered is None:
+            return None
+        return int(pc.sum(pc.match_substring(lowered, region)).as_py() or 0)
+    except Exception:
+        return None
+
+
+# -------------------------------------------------------
+# Function: _summarize_cached
+# -------------------------------------------------------
+# Purpose:
+# Build the summary of a CSV file (see CSVEngine.summarize) from the
+# cached statistics and, if a region was given, the region row count.
+# Callers must not mutate the returned dictionary.
+@lru_cache(maxsize=256)
+def _summarize_cached(path: str, mtime: float, region: str) -> Dict[str, Any]:
+    base = _describe_cached(path, mtime)
+    out: Dict[str, Any] = {k: base[k] for k in ("dataset", "rows", "columns")}
+
+    # ------------------------------------------------
+    # Region Filtering (if user mentioned a location)
+    # ------------------------------------------------
+    if region:
+        count = _region_rows(path, mtime, region)
+        if count is not None:
+            out["region_rows"] = count  # Count matching rows
+
+    if "numeric_summary" in base:
+        out["numeric_summary"] = base["numeric_summary"]
+
+    # Return the summary dictionary
+    return out
+
 
 # -------------------------------------------------------
 # Class: CSVEngine
@@ -34,18 +271,23 @@ class CSVEngine:
         else:
             search_dir = self.csv_dir
 
-        if not os.path.exists(search_dir):
+        # One stat call tells us both that the folder exists and whether
+        # its cached file listing is still current
+        try:
+            mtime_ns = os.stat(search_dir).st_mtime_ns
+        except OSError:
             search_dir = self.csv_dir
+            mtime_ns = os.stat(search_dir).st_mtime_ns
 
         # Now continue normally
-        files = [f for f in os.listdir(search_dir) if f.lower().endswith(".csv")]
+        files = _list_csvs(search_dir, mtime_ns)
         if not files:
             return None
 
-        for f in files:
-            if crop and crop in f.lower():
+        for f, lower in files:
+            if crop and crop in lower:
                 return os.path.join(search_dir, f)
-        return os.path.join(search_dir, files[0])
+        return os.path.join(search_dir, files[0][0])
 
 
     # ---------------------------------------------------
@@ -62,47 +304,69 @@ class CSVEngine:
         if not path:
             return {"summary": "No CSV datasets found.", "rows": 0}
 
-        # Try reading the CSV file safely
+        # Re-read only when the file changed since it was last summarized
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError as e:
+            return {"dataset": path, "error": f"Failed to read CSV: {str(e)}"}
+
+        region = (context.get("region") or "").lower()
+
+        # Copy so callers can't modify the cached summary
         try:
-            df = pd.read_csv(path)
+            return copy.deepcopy(_summarize_cached(path, mtime, region))
         except Exception as e:
             return {"dataset": path, "error": f"Failed to read CSV: {str(e)}"}
 
-        # Basic dataset info
-        out: Dict[str, Any] = {
-            "dataset": os.path.basename(path),  # File name
-            "rows": int(len(df)),               # Total number of rows
-            "columns": list(df.columns)         # List of column names
-        }
 
-        # ------------------------------------------------
-        # Region Filtering (if user mentioned a location)
-        # ------------------------------------------------
-        region = (context.get("region") or "").lower()
-        # Check if the dataset has region-like columns (e.g., state, county, zip)
-        for col in df.columns:
-            cl = col.lower()
-            if cl in {"county", "region", "state", "zip", "zipcode"} and region:
-                try:
-                    # Find rows matching the region name or ZIP code
-                    sub = df[df[col].astype(str).str.lower().str.contains(region, na=False)]
-                    out["region_rows"] = int(len(sub))  # Count matching rows
-                except Exception:
-                    pass
-                break  # Stop after first region match
-
-        # ------------------------------------------------
-        # Numeric Summary (statistics for numeric columns)
-        # ------------------------------------------------
-        numeric_cols = df.select_dtypes(include="number").columns.tolist()
-        if numeric_cols:
-            # Use pandas describe() to get summary stats (mean, min, max, etc.)
-            desc = df[numeric_cols].describe().to_dict()
-
-            # Convert all numeric values to float for JSON compatibility
-            out["numeric_summary"] = {
-                k: {m: float(v) for m, v in stats.items()} for k, stats in desc.items()
-            }
+# -------------------------------------------------------
+# Check: python -m holos.csv_rag [folder]
+# -------------------------------------------------------
+# Purpose:
+# Summarize every CSV under the data folder and compare the result
+# with pandas (read_csv + describe(), the reference implementation):
+# rows, columns and every numeric statistic must agree. Run it after
+# changing the readers or the statistics query, or after adding data.
+# Exits with status 1 if any file fails or differs.
+def _check(root: str) -> bool:
+    import math
+    ok = True
+    for folder, _, files in os.walk(root):
+        for f in sorted(files):
+            if not f.lower().endswith(".csv"):
+                continue
+            path = os.path.join(folder, f)
+            problems = []
+            try:
+                got = _summarize_cached(path, os.path.getmtime(path), "")
+                df = pd.read_csv(path)
+                numeric = df.select_dtypes(include="number")
+                want = numeric.describe().to_dict() if len(numeric.columns) else {}
+                if got["rows"] != len(df):
+                    problems.append(f"rows {got['rows']} != {len(df)}")
+                if got["columns"] != [str(c) for c in df.columns]:
+                    problems.append("column names differ")
+                summary = got.get("numeric_summary", {})
+                if set(summary) != set(want):
+                    problems.append(f"numeric columns differ: {sorted(set(summary) ^ set(want))}")
+                for col, stats in want.items():
+                    for stat, value in stats.items():
+                        mine = summary.get(col, {}).get(stat)
+                        if math.isnan(value):
+                            same = mine is None or math.isnan(mine)
+                        else:
+                            same = mine is not None and math.isclose(mine, value, rel_tol=1e-9, abs_tol=1e-9)
+                        if not same:
+                            problems.append(f"{col} {stat}: {mine} != {value}")
+            except Exception as e:
+                problems.append(f"failed: {e}")
+            ok = ok and not problems
+            print(("[OK]  " if not problems else "[FAIL] ") + path)
+            for p in problems[:10]:
+                print("       " + p)
+    return ok
+
 
-        # Return the summary dictionary
-        return out
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if _check(sys.argv[1] if len(sys.argv) > 1 else "data/docs") else 1)
@@ -0,0 +1,78 @@
+import zlib
+from starlette.responses import JSONResponse
+
+# Largest request body accepted after decompression (bytes)
+MAX_REQUEST_BODY = 1 << 20
+
+
+# -------------------------------------------------------
+# Middleware: GZipRequestMiddleware
+# -------------------------------------------------------
+# Purpose:
+# Accept gzip-compressed request bodies ("Content-Encoding: gzip"), as
+# sent by the Streamlit frontend for larger payloads. The body is
+# decompressed before FastAPI reads it, so the endpoints see plain JSON.
+# Bodies that are not valid gzip get a 400. Bodies larger than max_size,
+# compressed (checked while they are received) or after decompression,
+# get a 413, so neither a large upload nor a small compressed body that
+# inflates hugely can exhaust memory.
+# Requests without the header pass through untouched.
+class GZipRequestMiddleware:
+    def __init__(self, app, max_size: int = MAX_REQUEST_BODY):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _is_gzip(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        # Read the whole compressed body (at most max_size bytes)
+        chunks = []
+        size = 0
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_size:
+                await JSONResponse({"detail": "Request body too large"}, status_code=413)(scope, receive, send)
+                return
+            chunks.append(chunk)
+            more = message.get("more_body", False)
+
+        # Decompress (at most max_size + 1 bytes, to detect oversized bodies)
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(b"".join(chunks), self.max_size + 1)
+        except zlib.error:
+            await JSONResponse({"detail": "Invalid gzip request body"}, status_code=400)(scope, receive, send)
+            return
+        if len(body) > self.max_size:
+            await JSONResponse({"detail": "Request body too large"}, status_code=413)(scope, receive, send)
+            return
+        if not inflater.eof:
+            await JSONResponse({"detail": "Truncated gzip request body"}, status_code=400)(scope, receive, send)
+            return
+
+        # Hand the plain body on, with headers describing it
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        headers.append((b"content-length", str(len(body)).encode()))
+        scope = {**scope, "headers": headers}
+
+        sent = False
+
+        async def receive_plain():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, receive_plain, send)
+
+
+def _is_gzip(headers) -> bool:
+    return any(k == b"content-encoding" and v.strip().lower() == b"gzip" for k, v in headers)
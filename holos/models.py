@@ -1,5 +1,5 @@
 from typing import Optional, Dict, Any, List
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 # -------------------------------------------------------
 # Model: ChatRequest
@@ -9,12 +9,23 @@ from pydantic import BaseModel
 # It includes:
 # - session_id: unique identifier for the chat session
 # - message: user's question or input text
+# - messages: several messages sent in quick succession, answered as one
+#   turn (they are joined into 'message', one per line)
 # - context: additional information (like crop, region, soil, etc.)
 class ChatRequest(BaseModel):
     session_id: str                      # Unique session key for tracking the conversation
-    message: str                         # The user’s input message
+    message: str = ""                    # The user’s input message
+    messages: Optional[List[str]] = None  # Batched messages (joined into message)
     context: Optional[Dict[str, Any]] = None  # Optional background info (e.g., crop, region, season)
 
+    @model_validator(mode="after")
+    def _join_messages(self):
+        if self.messages:
+            self.message = "\n".join(([self.message] if self.message else []) + self.messages)
+        if not self.message:
+            raise ValueError("either 'message' or 'messages' is required")
+        return self
+
 
 # -------------------------------------------------------
 # Model: AssistantSections
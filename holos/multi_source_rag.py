@@ -1,5 +1,6 @@
 import os
 from typing import Dict, Any, List
+from typing_extensions import Annotated
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langchain_openai import ChatOpenAI
@@ -12,6 +13,16 @@ from .weather import load_weather       # Loads weather information
 from .csm_runner import CSMRunner       # Runs crop simulation model
 from .conversation import ensure_context  # Extracts and ensures context (crop, region, etc.)
 
+# -------------------------------------------------------
+# Reducer: keep the newest value
+# -------------------------------------------------------
+# Docs, CSV, and weather are filled by parallel branches. Giving
+# those keys a reducer lets LangGraph fan out from one node to
+# several; each key still has a single writer.
+def _latest(old: Any, new: Any) -> Any:
+    return new
+
+
 # -------------------------------------------------------
 # Class: GraphState (TypedDict)
 # -------------------------------------------------------
@@ -24,9 +35,9 @@ class GraphState(TypedDict, total=False):
     context: Dict[str, Any]
     missing: List[str]
     followup: str
-    docs: List[Dict[str, Any]]
-    csv: Dict[str, Any]
-    weather: Dict[str, Any]
+    docs: Annotated[List[Dict[str, Any]], _latest]
+    csv: Annotated[Dict[str, Any], _latest]
+    weather: Annotated[Dict[str, Any], _latest]
     csm: Dict[str, Any]
     reply: str
     sections: Dict[str, Any]
@@ -87,6 +98,16 @@ def node_weather(state: GraphState) -> GraphState:
     return {"weather": w}
 
 
+# -------------------------------------------------------
+# Join Node
+# -------------------------------------------------------
+# Waits until docs, CSV, and weather (which run in parallel)
+# have all finished. The state is already merged; LangGraph needs
+# every node to write a key, so the context is passed through.
+def node_join(state: GraphState) -> GraphState:
+    return {"context": state["context"]}
+
+
 # -------------------------------------------------------
 # Helper: Check if CSM can run
 # -------------------------------------------------------
@@ -129,18 +150,12 @@ def node_synthesize(state: GraphState) -> GraphState:
     docs = state.get("docs", [])
     csv = state.get("csv", {})
     weather = state.get("weather", {})
-    csm = state.get("csm", {})
+    csm = state.get("csm") or {}  # None when the CSM step was skipped
     ctx = state.get("context", {})
     follow = state.get("followup", "")
 
     # Combine document snippets (for the model to read)
-    doc_snips = "\n\n".join([f"- {d.get('content','')[:500]}" for d in docs])
-
-    # Collect sources for reference display
-    sources = []
-    for d in docs:
-        m = d.get("metadata") or {}
-        sources.append({"source": m.get("source", ""), "page": m.get("page", None)})
+    doc_snips = "\n\n".join([f"- {d.get('snippet') or d.get('content','')[:500]}" for d in docs])
 
     # Combine all information into the user's input prompt
     user = (
@@ -148,7 +163,7 @@ def node_synthesize(state: GraphState) -> GraphState:
         f"Context: {ctx}\n"
         f"CSV: {csv}\n"
         f"Weather: {weather}\n"
-        f"CSM: {csm}\n"
+        f"CSM: {dict(csm)}\n"
         f"Docs:\n{doc_snips}"
     )
 
@@ -166,13 +181,17 @@ def node_synthesize(state: GraphState) -> GraphState:
 
     # Create structured sections for the response
     sections = {
-        "rag_insights": docs[:3],
+        # "snippet" is only for the prompt; "content" already carries the text
+        "rag_insights": [{k: v for k, v in d.items() if k != "snippet"} for d in docs[:3]],
         "csv_findings": csv,
         "weather_context": weather,
-        "csm_results": csm if csm else {"note": "CSM skipped until crop+region are provided."},
+        "csm_results": dict(csm) if csm else {"note": "CSM skipped until crop+region are provided."},
         "recommendations": None,  # Can be filled later by the LLM
         "assumptions": {"missing": state.get("missing", [])},
-        "sources": sources
+        "sources": [                # Sources for reference display
+            {"source": m.get("source", ""), "page": m.get("page")}
+            for m in ((d.get("metadata") or {}) for d in docs)
+        ]
     }
     return {"reply": reply, "sections": sections, "context": ctx}
 
@@ -191,6 +210,7 @@ def build_graph():
         ("docs1", node_docs),
         ("csv1", node_csv),
         ("weather1", node_weather),
+        ("join1", node_join),
         ("csm1", node_csm),
         ("synthesize1", node_synthesize),
     ]:
@@ -201,11 +221,14 @@ def build_graph():
             # Ignore if the node already exists (for hot reloads)
             pass
     # Define the data flow between nodes
+    # Docs, CSV, and weather only need the context, so they run in
+    # parallel and meet again at join1 (wall time = slowest branch).
     g.add_edge(START, "context1")                          # Start → context extraction
     g.add_edge("context1", "docs1")                         # Context → document retrieval
-    g.add_edge("docs1", "csv1")                             # Docs → CSV data summary
-    g.add_edge("csv1", "weather1")                          # CSV → weather info
-    g.add_conditional_edges("weather1", can_run_csm, {     # Weather → CSM or Synthesis
+    g.add_edge("context1", "csv1")                          # Context → CSV data summary
+    g.add_edge("context1", "weather1")                      # Context → weather info
+    g.add_edge(["docs1", "csv1", "weather1"], "join1")      # Wait for all three branches
+    g.add_conditional_edges("join1", can_run_csm, {        # Join → CSM or Synthesis
         True: "csm1", 
         False: "synthesize1"
     })
@@ -1,11 +1,20 @@
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, DirectoryLoader, PyPDFLoader
+from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_community.document_loaders import UnstructuredWordDocumentLoader
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_openai import OpenAIEmbeddings
+from cachetools import LRUCache
+from .cache import SemanticCache
 from streamlit.runtime import state
 
 
@@ -20,13 +29,139 @@ load_dotenv()  # ensures .env is read even in standalone runs
 EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
 # Path for storing FAISS index (vector database)
-# Defaults to ~/.holos/faiss but can be overridden by VECTOR_PATH environment variable
+# Defaults to ~/.holos/faiss but can be overridden by VECTOR_PATH environment variable.
+# The index for the whole docs tree lives here; a crop/region-scoped
+# retriever keeps its own index in the matching subfolder
+# (e.g. <VECTOR_PATH>/rice/california).
 VECTOR_PATH = os.getenv("VECTOR_PATH", str(Path.home() / ".holos" / "faiss"))
 os.makedirs(VECTOR_PATH, exist_ok=True)  # Ensure directory exists
 
+# Loaded vector stores shared by all retrievers, keyed by index folder,
+# least recently used first. Holds at most VECTOR_STORE_CACHE stores.
+VECTOR_STORE_CACHE = int(os.getenv("VECTOR_STORE_CACHE", "8"))
+_STORE_CACHE: "OrderedDict[str, Any]" = OrderedDict()
+_STORE_LOCK = threading.Lock()
+
+# One lock per index folder: only one thread loads or builds a given
+# index while others wait and then reuse it
+_BUILD_LOCKS: Dict[str, threading.Lock] = {}
+
 # Default path where documents (text, PDFs, etc.) are stored
 DOCS_PATH = "data/docs/"
 
+# Document loader per file extension, and how many files are read at once
+LOADERS = {
+    ".txt": TextLoader,
+    ".md": TextLoader,
+    ".pdf": PyPDFLoader,
+    ".docx": UnstructuredWordDocumentLoader,
+}
+LOAD_WORKERS = int(os.getenv("DOC_LOAD_WORKERS", "16"))
+
+# Index build: texts per embeddings request, and how many requests run at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+
+# FAISS index type: "hnsw" (graph search, sub-linear top-k), "hnsw_fp16" /
+# "hnsw_int8" (same graph, vectors stored at 1/2 or 1/4 the memory) or
+# "flat" (exact brute-force scan). HNSW graph degree and search breadths:
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Number of query embeddings remembered by exact query text
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "4096"))
+
+# Semantic retrieval cache: paraphrased queries whose embeddings are at
+# least this similar reuse the previous top-k results
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+RETRIEVAL_CACHE_THRESHOLD = float(os.getenv("RETRIEVAL_CACHE_THRESHOLD", "0.95"))
+
+# Length of the document snippet sent to the LLM, in tokens
+# (125 tokens is about the 500 characters used before)
+SNIPPET_TOKENS = int(os.getenv("SNIPPET_TOKENS", "125"))
+
+
+# Retrieved chunks whose SimHash fingerprints differ in at most this
+# many of 64 bits are treated as duplicates (only the first is kept)
+DEDUP_HAMMING = int(os.getenv("DEDUP_HAMMING", "5"))
+
+_BIT_SHIFTS = np.arange(64, dtype=np.uint64)
+
+
+# -------------------------------------------------------
+# Function: _simhash
+# -------------------------------------------------------
+# Purpose:
+# 64-bit SimHash of a text over its word 3-grams: every shingle is
+# hashed (md5) and votes on each bit, so similar texts get
+# fingerprints that differ in only a few bits. Cached on the text.
+@lru_cache(maxsize=4096)
+def _simhash(text: str) -> int:
+    words = text.lower().split()
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.md5(sh.encode()).digest()[:8], "little") for sh in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    bits = (hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+    return sum(1 << int(i) for i in np.flatnonzero(votes > 0))
+
+
+# -------------------------------------------------------
+# Function: _dedupe
+# -------------------------------------------------------
+# Purpose:
+# Drop near-duplicate chunks (e.g. the same passage indexed from two
+# files) so the prompt does not repeat itself. Takes the (document,
+# score) pairs of a search and keeps the rank order.
+def _dedupe(hits: List[Tuple[Any, float]]) -> List[Tuple[Any, float]]:
+    kept, prints = [], []
+    for d, score in hits:
+        fp = _simhash(d.page_content)
+        if all((fp ^ other).bit_count() > DEDUP_HAMMING for other in prints):
+            kept.append((d, score))
+            prints.append(fp)
+    return kept
+
+
+# -------------------------------------------------------
+# Function: _tokenizer
+# -------------------------------------------------------
+# Purpose:
+# Load the tiktoken encoding for the chat model once. Returns None
+# when it is not available (e.g. no network to fetch the encoding),
+# in which case snippets are cut by characters instead.
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(os.getenv("MODEL_NAME", "gpt-4o-mini"))
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"[WARN] tiktoken encoding unavailable ({e}); snippets are cut by characters")
+        return None
+
+
+# -------------------------------------------------------
+# Function: _snippet
+# -------------------------------------------------------
+# Purpose:
+# First SNIPPET_TOKENS tokens of a document chunk. Cached on the
+# chunk text, so each chunk is tokenized only once.
+@lru_cache(maxsize=4096)
+def _snippet(text: str) -> str:
+    enc = _tokenizer()
+    if enc is None:
+        return text[:SNIPPET_TOKENS * 4]
+    ids = enc.encode(text, disallowed_special=())
+    return text if len(ids) <= SNIPPET_TOKENS else enc.decode(ids[:SNIPPET_TOKENS])
+
+
 # -------------------------------------------------------
 # Class: RAGRetriever
 # -------------------------------------------------------
@@ -54,8 +189,19 @@ class RAGRetriever:
 
         self.docs_root = crop_region_path if os.path.exists(crop_region_path) else docs_path
 
+        # Each docs scope gets its own index folder (mirrors the docs layout)
+        scope = os.path.relpath(self.docs_root, docs_path)
+        self.index_path = VECTOR_PATH if scope == "." else os.path.join(VECTOR_PATH, scope)
+
         # Initialize OpenAI embedding model
         self.embeddings = OpenAIEmbeddings(model=EMBED_MODEL)
+        # Remember query embeddings by exact text: the API's response cache
+        # and retrieve() embed the same message back to back, and repeated
+        # questions skip the embeddings request entirely
+        self._query_vecs = LRUCache(maxsize=QUERY_EMBED_CACHE_SIZE)
+        self._query_lock = threading.Lock()
+        # Recent retrieval results, looked up by query embedding similarity
+        self._results_cache = SemanticCache(maxsize=RETRIEVAL_CACHE_SIZE, threshold=RETRIEVAL_CACHE_THRESHOLD)
         # Load an existing FAISS index or build a new one
         self.vs = self._load_or_build()
 
@@ -63,41 +209,69 @@ class RAGRetriever:
     # Function: _load_or_build
     # ---------------------------------------------------
     # Purpose:
-    # Checks if a FAISS index already exists. If yes, loads it.
-    # Otherwise, scans document folders, splits them into chunks,
-    # creates embeddings, and builds a new FAISS index.
-    def _load_or_build(self):
-        idx_file = os.path.join(VECTOR_PATH, "index.faiss")
-
-        # If an index already exists, load it from disk
-        if os.path.exists(idx_file):
-            return FAISS.load_local(VECTOR_PATH, self.embeddings, allow_dangerous_deserialization=True)
-
-        # If no index exists, create the folder
-        os.makedirs(VECTOR_PATH, exist_ok=True)
-        docs = []
-
-        # Define supported file loaders (scan the docs_root recursively)
-        loaders = [
-            DirectoryLoader(self.docs_root, glob="**/*.txt", loader_cls=TextLoader,silent_errors=True, show_progress=True),
-            DirectoryLoader(self.docs_root, glob="**/*.md", loader_cls=TextLoader,silent_errors=True, show_progress=True),
-            DirectoryLoader(self.docs_root, glob="**/*.pdf", loader_cls=PyPDFLoader, silent_errors=True, show_progress=True),
-            #DirectoryLoader(self.docs_root, glob="**/*.docx", loader_cls=TextLoader,silent_errors=True, show_progress=True),
-            DirectoryLoader(self.docs_root, glob="**/*.docx", loader_cls=UnstructuredWordDocumentLoader,silent_errors=True, show_progress=True),
-        ]
-
-        
-
-        # Try loading files from each loader (they will walk subfolders)
-        for ld in loaders:
-            try:
-                #print(ld , " In load or build ..in rag...trying to load")
-                docs.extend(ld.load())
-            except Exception:
-                # If a loader fails for some reason, skip it and continue
-                #print(ld, " In load or build ..in rag...loader failed")
-                pass
-                #continue
+    # Reuses the vector store for this scope if another retriever
+    # already loaded it. Otherwise checks if a FAISS index already
+    # exists on disk and loads it, or (when `build` is True) builds
+    # a new one. Concurrent callers for the same index wait for the
+    # first one instead of loading/building it again.
+    def _load_or_build(self, build: bool = True):
+        vs = self._cached_store()
+        if vs is not None:
+            return vs
+
+        with _STORE_LOCK:
+            lock = _BUILD_LOCKS.setdefault(self.index_path, threading.Lock())
+        with lock:
+            # Another thread may have finished while we were waiting
+            vs = self._cached_store()
+            if vs is not None:
+                return vs
+
+            # If an index already exists, load it from disk
+            if os.path.exists(os.path.join(self.index_path, "index.faiss")):
+                vs = self._load_local()
+            elif build:
+                vs = self._build()
+
+            if vs is not None:
+                self._remember_store(vs)
+        return vs
+
+    # ---------------------------------------------------
+    # Function: _cached_store / _remember_store
+    # ---------------------------------------------------
+    # Purpose:
+    # Process-wide LRU of loaded vector stores by index folder, so
+    # switching between scopes does not re-read the index from disk.
+    def _cached_store(self):
+        with _STORE_LOCK:
+            vs = _STORE_CACHE.get(self.index_path)
+            if vs is not None:
+                _STORE_CACHE.move_to_end(self.index_path)
+            return vs
+
+    def _remember_store(self, vs) -> None:
+        with _STORE_LOCK:
+            _STORE_CACHE[self.index_path] = vs
+            _STORE_CACHE.move_to_end(self.index_path)
+            while len(_STORE_CACHE) > VECTOR_STORE_CACHE:
+                _STORE_CACHE.popitem(last=False)  # evict least recently used
+
+    # ---------------------------------------------------
+    # Function: _build
+    # ---------------------------------------------------
+    # Purpose:
+    # Scans document folders, splits them into chunks, creates
+    # embeddings, and builds and saves a new FAISS index.
+    def _build(self):
+        # Create the index folder
+        os.makedirs(self.index_path, exist_ok=True)
+
+        # Walk the docs_root tree once, pick the loader for each file by
+        # its extension, and read the files in parallel
+        paths = self._find_documents(self.docs_root)
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            docs = [d for loaded in pool.map(self._load_file, paths) for d in loaded]
 
         # If no documents found, return None (no retriever)
         if not docs:
@@ -111,13 +285,128 @@ class RAGRetriever:
         )
         splits = splitter.split_documents(docs)
 
-        # Build FAISS vector store (embedding index)
-        vs = FAISS.from_documents(splits, self.embeddings)
+        # Embed all chunks in concurrent batches, then build the FAISS
+        # vector store (embedding index) from the ready-made vectors
+        texts = [s.page_content for s in splits]
+        vecs = self._embed_texts(texts)
+        vs = FAISS(embedding_function=self.embeddings, index=self._new_index(vecs),
+                   docstore=InMemoryDocstore(), index_to_docstore_id={})
+        vs.add_embeddings(list(zip(texts, vecs)), metadatas=[s.metadata for s in splits])
 
         # Save the index locally for reuse
-        vs.save_local(VECTOR_PATH)
+        vs.save_local(self.index_path)
+        return vs
+
+    # ---------------------------------------------------
+    # Function: _find_documents
+    # ---------------------------------------------------
+    # Purpose:
+    # List every supported document under `root` in a single
+    # os.walk pass (hidden files and folders are skipped).
+    @staticmethod
+    def _find_documents(root: str) -> List[str]:
+        paths = []
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.startswith(".") and os.path.splitext(name)[1].lower() in LOADERS:
+                    paths.append(os.path.join(folder, name))
+        return sorted(paths)
+
+    # Load one file; a file that fails to load is skipped
+    @staticmethod
+    def _load_file(path: str) -> List[Any]:
+        try:
+            return LOADERS[os.path.splitext(path)[1].lower()](path).load()
+        except Exception:
+            return []
+
+    # ---------------------------------------------------
+    # Function: _new_index
+    # ---------------------------------------------------
+    # Purpose:
+    # Create the FAISS index selected by VECTOR_INDEX for `vecs`.
+    # HNSW searches a neighbour graph instead of scanning every
+    # chunk, so top-k stays fast as the corpus grows. The fp16/int8
+    # variants scalar-quantize the stored vectors, which cuts memory
+    # and the bytes read per distance; they are trained on `vecs`
+    # (vectors are added afterwards by the caller).
+    @staticmethod
+    def _new_index(vecs: List[List[float]]):
+        import faiss
+        dim = len(vecs[0])
+        if VECTOR_INDEX == "flat":
+            return faiss.IndexFlatL2(dim)
+
+        quantizers = {
+            "hnsw_fp16": faiss.ScalarQuantizer.QT_fp16,
+            "hnsw_int8": faiss.ScalarQuantizer.QT_8bit,
+        }
+        if VECTOR_INDEX in quantizers:
+            index = faiss.IndexHNSWSQ(dim, quantizers[VECTOR_INDEX], HNSW_M)
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        if not index.is_trained:
+            index.train(np.asarray(vecs, dtype=np.float32))  # learns per-dimension value ranges
+        return index
+
+    # ---------------------------------------------------
+    # Function: _load_local
+    # ---------------------------------------------------
+    # Purpose:
+    # Load the saved FAISS index and apply the search settings.
+    def _load_local(self):
+        vs = FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
+        if hasattr(vs.index, "hnsw"):
+            vs.index.hnsw.efSearch = HNSW_EF_SEARCH
         return vs
 
+    # ---------------------------------------------------
+    # Function: _embed_texts
+    # ---------------------------------------------------
+    # Purpose:
+    # Embed many texts for the index build. Texts are split into
+    # batches of EMBED_BATCH_SIZE and up to EMBED_WORKERS batches
+    # are sent to the embeddings API at the same time.
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        if len(batches) <= 1:
+            return self.embeddings.embed_documents(texts, chunk_size=EMBED_BATCH_SIZE)
+
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+            parts = pool.map(lambda b: self.embeddings.embed_documents(b, chunk_size=EMBED_BATCH_SIZE), batches)
+            return [v for part in parts for v in part]
+
+    # ---------------------------------------------------
+    # Function: embed_queries
+    # ---------------------------------------------------
+    # Purpose:
+    # Return the embedding vectors for several queries (cached per
+    # query text). Queries not in the cache are embedded with a
+    # single embeddings request.
+    # Vectors are kept as read-only float32 arrays (~6 KB each for
+    # 1536 dims, a fraction of a tuple of Python floats).
+    def embed_queries(self, queries: List[str]) -> List[np.ndarray]:
+        with self._query_lock:
+            vecs = [self._query_vecs.get(q) for q in queries]
+
+        missing = list(dict.fromkeys(q for q, v in zip(queries, vecs) if v is None))
+        if missing:
+            fresh = {}
+            for q, v in zip(missing, self.embeddings.embed_documents(missing)):
+                arr = np.asarray(v, dtype=np.float32)
+                arr.setflags(write=False)
+                fresh[q] = arr
+            with self._query_lock:
+                self._query_vecs.update(fresh)
+            vecs = [fresh[q] if v is None else v for q, v in zip(queries, vecs)]
+        return vecs
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embed_queries([query])[0]
+
     # ---------------------------------------------------
     # Function: retrieve
     # ---------------------------------------------------
@@ -129,23 +418,35 @@ class RAGRetriever:
 
         # If FAISS index is not loaded (maybe just created elsewhere), try loading it
         if vs is None:
-            idx_file = os.path.join(VECTOR_PATH, "index.faiss")
-            if os.path.exists(idx_file):
-                vs = FAISS.load_local(VECTOR_PATH, self.embeddings, allow_dangerous_deserialization=True)
-                self.vs = vs
-            else:
+            vs = self._load_or_build(build=False)
+            if vs is None:
                 return []  # No index available → return empty list
+            self.vs = vs
+
+        # A near-identical earlier query (same docs folder and k) already
+        # has its results cached: skip the FAISS search
+        vec = self.embed_query(query)
+        scope = (self.docs_root, k)
+        hit = self._results_cache.get(scope, vec)
+        if hit is not None:
+            return list(hit)
+
+        # Search the top-k similar chunks directly in FAISS with the
+        # (cached) query vector, keeping each chunk's distance
+        hits = vs.similarity_search_with_score_by_vector(vec, k=k)
 
-        # Create a retriever object to search top-k similar chunks
-        retriever = vs.as_retriever(search_kwargs={"k": k})
-        docs = retriever.get_relevant_documents(query)
+        # Remove near-duplicate chunks before they reach the prompt
+        hits = _dedupe(hits)
 
         # Convert LangChain Document objects into simple dicts
         results = []
-        for d in docs:
+        for d, score in hits:
             results.append({
                 "content": d.page_content,  # Extracted text
+                "snippet": _snippet(d.page_content),  # Shortened text for the LLM prompt
+                "score": float(score),      # Distance to the query (lower = closer)
                 "metadata": {**(d.metadata or {}), "source": (d.metadata or {}).get("source", "")}
             })
 
-        return results  # Return the top matching chunks
+        self._results_cache.put(scope, vec, results)
+        return list(results)  # Return the top matching chunks
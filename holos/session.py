@@ -0,0 +1,117 @@
+import os
+from collections import deque
+import msgpack
+from typing import Dict, Any, List
+from cachetools import TTLCache
+
+# -------------------------------------------------------
+# Session Store Configuration
+# -------------------------------------------------------
+# How long an idle session (context + history) is kept, in seconds
+SESSION_TTL = 3600
+
+# Maximum number of sessions kept by the in-process fallback store
+SESSION_MAX = 10_000
+
+# Number of past exchanges kept as short-term memory
+HISTORY_TURNS = 8
+
+
+# -------------------------------------------------------
+# Class: MemorySessionStore
+# -------------------------------------------------------
+# Purpose:
+# Keeps session context and chat history inside the API process.
+# Entries expire after SESSION_TTL and the number of sessions is capped,
+# so memory stays bounded. Used when Redis is not configured.
+class MemorySessionStore:
+    def __init__(self, maxsize: int = SESSION_MAX, ttl: int = SESSION_TTL):
+        self._ctx = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._history = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get_context(self, session_id: str) -> Dict[str, Any]:
+        return dict(self._ctx.get(session_id) or {})
+
+    async def set_context(self, session_id: str, ctx: Dict[str, Any]) -> None:
+        self._ctx[session_id] = dict(ctx or {})
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        return list(self._history.get(session_id) or [])
+
+    async def append_turn(self, session_id: str, user: str, bot: str) -> None:
+        history = self._history.get(session_id)
+        if history is None:
+            history = deque(maxlen=HISTORY_TURNS)  # keeps only the last exchanges
+        history.append({"user": user, "bot": bot})
+        self._history[session_id] = history  # (re)set to refresh the TTL
+
+
+# -------------------------------------------------------
+# Class: RedisSessionStore
+# -------------------------------------------------------
+# Purpose:
+# Keeps session context and chat history in Redis so every API worker
+# sees the same sessions and they survive restarts.
+# - context: hash "ctx:<session_id>" (one msgpack-encoded value per field)
+# - history: capped list "hist:<session_id>" (newest exchange first,
+#   each exchange msgpack-encoded)
+# Both keys expire after SESSION_TTL of inactivity.
+# msgpack is smaller and faster to encode/decode than JSON.
+class RedisSessionStore:
+    def __init__(self, url: str, ttl: int = SESSION_TTL):
+        import redis.asyncio as redis
+        self._r = redis.from_url(url)  # raw bytes: values are msgpack-encoded
+        self._ttl = ttl
+
+    # Decode a stored value
+    @staticmethod
+    def _unpack(raw: bytes) -> Any:
+        return msgpack.unpackb(raw)
+
+    async def get_context(self, session_id: str) -> Dict[str, Any]:
+        raw = await self._r.hgetall(f"ctx:{session_id}")
+        return {k.decode(): self._unpack(v) for k, v in raw.items()}
+
+    async def set_context(self, session_id: str, ctx: Dict[str, Any]) -> None:
+        key = f"ctx:{session_id}"
+        async with self._r.pipeline(transaction=True) as pipe:
+            pipe.delete(key)  # replace the whole context, not merge into it
+            if ctx:
+                pipe.hset(key, mapping={k: msgpack.packb(v) for k, v in ctx.items()})
+                pipe.expire(key, self._ttl)
+            await pipe.execute()
+
+    async def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        raw = await self._r.lrange(f"hist:{session_id}", 0, HISTORY_TURNS - 1)
+        return [self._unpack(x) for x in reversed(raw)]  # oldest first
+
+    async def append_turn(self, session_id: str, user: str, bot: str) -> None:
+        key = f"hist:{session_id}"
+        async with self._r.pipeline(transaction=True) as pipe:
+            pipe.lpush(key, msgpack.packb({"user": user, "bot": bot}))
+            pipe.ltrim(key, 0, HISTORY_TURNS - 1)
+            pipe.expire(key, self._ttl)
+            await pipe.execute()
+
+
+# -------------------------------------------------------
+# Function: create_session_store
+# -------------------------------------------------------
+# Purpose:
+# Use Redis when REDIS_URL is set and the server answers a ping,
+# otherwise the in-process store.
+# Reads the environment at call time so values from .env are honoured.
+def create_session_store():
+    ttl = int(os.getenv("SESSION_TTL", SESSION_TTL))
+    url = os.getenv("REDIS_URL")
+    if url:
+        try:
+            # The async client only connects on first use, so check the
+            # server with a short blocking ping before relying on it
+            import redis
+            with redis.Redis.from_url(url, socket_connect_timeout=2, socket_timeout=2) as probe:
+                probe.ping()
+            return RedisSessionStore(url, ttl=ttl)
+        except Exception as e:
+            print(f"[WARN] Redis session store unavailable ({e}); using in-process store")
+    return MemorySessionStore(maxsize=int(os.getenv("SESSION_MAX", SESSION_MAX)), ttl=ttl)
@@ -1,7 +1,9 @@
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from typing_extensions import TypedDict
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
@@ -68,6 +70,22 @@ class ChatState(TypedDict, total=False):
     csm: Dict[str, Any]
     reply: str
     sections: Dict[str, Any]
+    failed: bool          # True when the LLM call failed (reply is a fallback)
+
+# Arguments of a single chat request: (message, session_id, context, history)
+ChatArgs = Tuple[str, str, Optional[Dict[str, Any]], Optional[List[Dict[str, str]]]]
+
+# Thread pool used to collect data for batched requests concurrently
+_io_pool = ThreadPoolExecutor(max_workers=int(os.getenv("RAG_IO_WORKERS", "8")), thread_name_prefix="holos-rag")
+
+# Separate pool for the independent steps inside one request (docs, CSV).
+# Kept apart from _io_pool so a full batch cannot wait on its own workers.
+_step_pool = ThreadPoolExecutor(max_workers=int(os.getenv("RAG_STEP_WORKERS", "16")), thread_name_prefix="holos-step")
+
+# Source reference (file + page) of a retrieved document
+def _source(d: Dict[str, Any]) -> Dict[str, Any]:
+    m = d.get("metadata") or {}
+    return {"source": m.get("source", ""), "page": m.get("page")}
 
 class ChatProcessor:
     def __init__(self):
@@ -82,39 +100,80 @@ class ChatProcessor:
         except Exception:
             self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
 
-    def process_message(
-    self,
-    message: str,
-    session_id: str,
-    context: Optional[Dict[str, Any]] = None,
-    history: Optional[List[Dict[str, str]]] = None
-) -> ChatState:
+    # ---------------------------------------------------
+    # Function: collect
+    # ---------------------------------------------------
+    # Purpose:
+    # Run every step before the LLM call (context, docs, CSV,
+    # weather, CSM) and return the partially filled state.
+    def collect(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]] = None
+    ) -> ChatState:
+        state = self._context_step(message, session_id, context)
+
+        # Steps 2-4 only need the context, so run them in parallel:
+        # document retrieval and the CSV summary go to the step pool
+        # while weather loads in this thread.
+        docs_f = _step_pool.submit(self.retriever.retrieve, message, 5)
+        csv_f = _step_pool.submit(self.csv_engine.summarize, message, state["context"])
 
+        # Step 4: Weather Data
+        state["weather"] = load_weather(state["context"])
+
+        # Step 2: Document Retrieval
+        state["docs"] = docs_f.result()
+
+        # Step 3: CSV Data Summary
+        state["csv"] = csv_f.result()
+
+        return self._csm_step(state)
+
+    # ---------------------------------------------------
+    # Function: acollect
+    # ---------------------------------------------------
+    # Purpose:
+    # Async version of collect for callers on an event loop:
+    # steps 2-4 run concurrently in threads and are awaited together.
+    async def acollect(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]] = None
+    ) -> ChatState:
+        state = self._context_step(message, session_id, context)
+
+        state["docs"], state["csv"], state["weather"] = await asyncio.gather(
+            asyncio.to_thread(self.retriever.retrieve, message, 5),
+            asyncio.to_thread(self.csv_engine.summarize, message, state["context"]),
+            asyncio.to_thread(load_weather, state["context"]),
+        )
+
+        return self._csm_step(state)
+
+    # Step 1: Context Extraction
+    def _context_step(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]]
+    ) -> ChatState:
         state: ChatState = {
             "message": message,
             "session_id": session_id,
             "context": context or {}
         }
 
-        # Step 1: Context Extraction
         ctx, missing, follow = ensure_context(message, state["context"])
         state["context"] = ctx
         state["missing"] = missing
         state["followup"] = follow
+        return state
 
-        # Step 2: Document Retrieval
-        docs = self.retriever.retrieve(message, k=5)
-        state["docs"] = docs
-
-        # Step 3: CSV Data Summary
-        data = self.csv_engine.summarize(message, state["context"])
-        state["csv"] = data
-
-        # Step 4: Weather Data
-        weather = load_weather(state["context"])
-        state["weather"] = weather
-
-        # Step 5: CSM (if context allows)
+    # Step 5: CSM (if context allows)
+    def _csm_step(self, state: ChatState) -> ChatState:
         if state["context"].get("crop") and state["context"].get("region"):
             params = {
                 "crop": state["context"].get("crop"),
@@ -128,15 +187,26 @@ class ChatProcessor:
         else:
             state["csm"] = {}
 
-        # Step 6: Synthesis
-        sys_prompt = (
-    "You are Holos Agri Assistant, a friendly and knowledgeable agricultural advisor. "
-    "After giving your main answer, naturally add only ONE short, helpful follow-up question—"
-    "like a continuation prompt a human might ask (e.g., 'Would you like me to show examples?' or "
-    "'Want me to explain that further?'). "
-    "Avoid repeating or listing multiple questions. Keep it conversational."
-)
+        return state
 
+    # ---------------------------------------------------
+    # Function: build_messages
+    # ---------------------------------------------------
+    # Purpose:
+    # Turn the collected state and short-term history into
+    # the message list sent to the LLM.
+    def build_messages(
+        self,
+        state: ChatState,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Any]:
+        sys_prompt = (
+            "You are Holos Agri Assistant, a friendly and knowledgeable agricultural advisor. "
+            "After giving your main answer, naturally add only ONE short, helpful follow-up question—"
+            "like a continuation prompt a human might ask (e.g., 'Would you like me to show examples?' or "
+            "'Want me to explain that further?'). "
+            "Avoid repeating or listing multiple questions. Keep it conversational."
+        )
 
         # Extract data from state
         docs = state.get("docs", [])
@@ -144,64 +214,159 @@ class ChatProcessor:
         weather = state.get("weather", {})
         csm = state.get("csm", {})
         ctx = state.get("context", {})
-        follow = state.get("followup", "")
 
         # Combine document snippets
-        doc_snips = "\n\n".join([f"- {d.get('content','')[:500]}" for d in docs])
-
-        # Collect sources
-        sources = []
-        for d in docs:
-            m = d.get("metadata") or {}
-            sources.append({"source": m.get("source", ""), "page": m.get("page", None)})
+        doc_snips = "\n\n".join([f"- {d.get('snippet') or d.get('content','')[:500]}" for d in docs])
 
         # Combine all information
         user_prompt = (
-            f"User question: {message}\n"
+            f"User question: {state['message']}\n"
             f"Context: {ctx}\n"
             f"CSV: {csv}\n"
             f"Weather: {weather}\n"
-            f"CSM: {csm}\n"
+            f"CSM: {dict(csm)}\n"
             f"Docs:\n{doc_snips}"
         )
 
-        # Generate reply
-        try:
-            messages = [SystemMessage(content=sys_prompt)]
-
-            # Add short-term memory (previous exchanges)
-            for h in (history or []):
-                messages.append(HumanMessage(content=h["user"]))
-                messages.append(HumanMessage(content=h["bot"]))  # treat last reply as conversational context
+        messages = [SystemMessage(content=sys_prompt)]
 
-            # Add the new question
-            messages.append(HumanMessage(content=user_prompt))
+        # Add short-term memory (previous exchanges)
+        for h in (history or []):
+            messages.append(HumanMessage(content=h["user"]))
+            messages.append(HumanMessage(content=h["bot"]))  # treat last reply as conversational context
 
-            res = self.llm.invoke(messages)
-
-            reply = res.content
-        except Exception as e:
-            reply = f"I hit an issue synthesizing the answer: {e}. Here are the findings from docs and data."
-
-        
+        # Add the new question
+        messages.append(HumanMessage(content=user_prompt))
+        return messages
 
+    # ---------------------------------------------------
+    # Function: finish
+    # ---------------------------------------------------
+    # Purpose:
+    # Attach the reply and the structured response sections.
+    def finish(self, state: ChatState, reply: str) -> ChatState:
+        docs = state.get("docs", [])
+        csm = state.get("csm", {})
 
-        # Structure the response
+        # Structure the response (sources collected in one pass)
         sections = {
-            "rag_insights": docs[:3],
-            "csv_findings": csv,
-            "weather_context": weather,
-            "csm_results": csm if csm else {"note": "CSM skipped until crop+region are provided."},
+            # "snippet" is only for the prompt; "content" already carries the text
+        "rag_insights": [{k: v for k, v in d.items() if k != "snippet"} for d in docs[:3]],
+            "csv_findings": state.get("csv", {}),
+            "weather_context": state.get("weather", {}),
+            "csm_results": dict(csm) if csm else {"note": "CSM skipped until crop+region are provided."},
             "recommendations": None,
             "assumptions": {"missing": state.get("missing", [])},
-            "sources": sources
+            "sources": [_source(d) for d in docs]
         }
 
         state["reply"] = reply
         state["sections"] = sections
-
         return state
 
+    def process_message(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> ChatState:
+        state = self.collect(message, session_id, context)
+
+        # Generate reply
+        try:
+            res = self.llm.invoke(self.build_messages(state, history))
+            reply = res.content
+        except Exception as e:
+            reply = f"I hit an issue synthesizing the answer: {e}. Here are the findings from docs and data."
+            state["failed"] = True
+
+        return self.finish(state, reply)
+
+    # ---------------------------------------------------
+    # Function: aprocess_message
+    # ---------------------------------------------------
+    # Purpose:
+    # Async version of process_message: data collection runs in
+    # threads and the LLM call is awaited without holding a thread.
+    async def aprocess_message(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> ChatState:
+        state = await self.acollect(message, session_id, context)
+
+        # Generate reply
+        try:
+            res = await self.llm.ainvoke(self.build_messages(state, history))
+            reply = res.content
+        except Exception as e:
+            reply = f"I hit an issue synthesizing the answer: {e}. Here are the findings from docs and data."
+            state["failed"] = True
+
+        return self.finish(state, reply)
+
+    # ---------------------------------------------------
+    # Function: stream_message
+    # ---------------------------------------------------
+    # Purpose:
+    # Same as process_message, but the reply is streamed from the
+    # LLM as it is generated. Yields ("token", text) for each piece
+    # of the reply and finally ("done", state) with the full state.
+    def stream_message(
+        self,
+        message: str,
+        session_id: str,
+        context: Optional[Dict[str, Any]] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Iterator[Tuple[str, Any]]:
+        state = self.collect(message, session_id, context)
+
+        parts = []
+        try:
+            for chunk in self.llm.stream(self.build_messages(state, history)):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield "token", chunk.content
+        except Exception as e:
+            # Keep what was already sent and append the fallback note
+            note = f"I hit an issue synthesizing the answer: {e}. Here are the findings from docs and data."
+            if parts:
+                note = "\n\n" + note
+            parts.append(note)
+            state["failed"] = True
+            yield "token", note
+
+        yield "done", self.finish(state, "".join(parts))
+
+    # ---------------------------------------------------
+    # Function: process_batch
+    # ---------------------------------------------------
+    # Purpose:
+    # Answer several chat requests together. Collection runs
+    # concurrently per request, then the prompts go to llm.batch
+    # (one parallel LLM request per prompt, not a single call).
+    def process_batch(self, requests: List[ChatArgs]) -> List[ChatState]:
+        states = list(_io_pool.map(lambda r: self.collect(r[0], r[1], r[2]), requests))
+        prompts = [self.build_messages(st, r[3]) for st, r in zip(states, requests)]
+
+        try:
+            results = self.llm.batch(prompts, return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(prompts)
+
+        out = []
+        for st, res in zip(states, results):
+            if isinstance(res, Exception):
+                reply = f"I hit an issue synthesizing the answer: {res}. Here are the findings from docs and data."
+                st["failed"] = True
+            else:
+                reply = res.content
+            out.append(self.finish(st, reply))
+        return out
+
 # Create a singleton instance
 processor = ChatProcessor()
 
@@ -213,3 +378,25 @@ def process_chat(
 ) -> ChatState:
     """Main entry point for chat processing"""
     return processor.process_message(message, session_id, context, history)
+
+async def aprocess_chat(
+    message: str,
+    session_id: str,
+    context: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Dict[str, str]]] = None
+) -> ChatState:
+    """Async entry point for callers running on an event loop"""
+    return await processor.aprocess_message(message, session_id, context, history)
+
+def process_chat_batch(requests: List[ChatArgs]) -> List[ChatState]:
+    """Batch entry point: each item is (message, session_id, context, history)"""
+    return processor.process_batch(requests)
+
+def stream_chat(
+    message: str,
+    session_id: str,
+    context: Optional[Dict[str, Any]] = None,
+    history: Optional[List[Dict[str, str]]] = None
+) -> Iterator[Tuple[str, Any]]:
+    """Streaming entry point: yields ("token", text) pieces, then ("done", state)"""
+    return processor.stream_message(message, session_id, context, history)
@@ -1,5 +1,20 @@
-import json, os
+import os, copy
+import orjson
 from typing import Dict, Any
+from functools import lru_cache
+
+# -------------------------------------------------------
+# Function: _load_json
+# -------------------------------------------------------
+# Purpose:
+# Parse a weather JSON file once per (path, modification time).
+# Weather files change rarely, so repeat calls are dict lookups;
+# editing a file changes its mtime and invalidates the entry.
+# The cached object is shared: callers get a copy (see load_weather).
+@lru_cache(maxsize=64)
+def _load_json(path: str, mtime: float) -> Any:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 # -------------------------------------------------------
 # Function: load_weather
@@ -28,11 +43,14 @@ def load_weather(context: Dict[str, Any]) -> Dict[str, Any]:
 
     # Try loading each file until one is found and successfully opened
     for p in candidates:
-        if os.path.exists(p):  # Check if file exists
-            try:
-                return json.load(open(p))  # Load and return weather data as dictionary
-            except Exception:
-                pass  # If file is corrupted or invalid JSON, skip to next option
+        try:
+            mtime = os.stat(p).st_mtime  # Check if file exists (and when it last changed)
+        except OSError:
+            continue
+        try:
+            return copy.copy(_load_json(p, mtime))  # Load and return weather data as dictionary
+        except Exception:
+            pass  # If file is corrupted or invalid JSON, skip to next option
 
     # If no file was found or successfully loaded, return a fallback message
     return {
@@ -1,4 +1,5 @@
-import os, requests, streamlit as st
+import os, gzip, time, httpx, orjson, streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 
 # st.markdown("<style>.stChatMessage.user {text-align: right;}</style>", unsafe_allow_html=True)
 
@@ -11,10 +12,178 @@ import os, requests, streamlit as st
 API_URL = os.getenv("API_URL", "http://localhost:8001/chat")
 API_URL = "http://172.31.23.62:8001/chat"
 
+# Streaming variant of the chat endpoint (reply arrives token by token)
+STREAM_URL = API_URL.rstrip("/") + "/stream"
+
+# Cheap backend endpoint used to open the connection at startup
+HEALTH_URL = API_URL.rsplit("/chat", 1)[0] + "/health"
+
+# Request bodies larger than this (bytes) are sent gzip-compressed
+GZIP_MIN_SIZE = 1024
+
+# Longest message accepted from the chat box (characters)
+MAX_INPUT_CHARS = 4000
+
+# Chat history kept (and shown) per session: older messages are dropped.
+# The backend keeps its own short history for the conversation context.
+MAX_MESSAGES = 100
+
+# Messages drawn on each run (the most recent ones); earlier messages
+# are drawn only after the user asks for them
+HISTORY_SHOWN = 20
+
+# How long an idle connection to the backend is kept open (seconds);
+# must stay below the backend's keep-alive timeout (uvicorn
+# --timeout-keep-alive 300 in the README)
+KEEPALIVE_SECONDS = 240
+
+# Threads that receive replies from the backend, shared by all sessions
+REPLY_WORKERS = 8
+
+
+# -------------------------------------------------------
+# Function: get_client
+# -------------------------------------------------------
+# Purpose:
+# One pooled HTTP client for the whole Streamlit server (kept across
+# reruns and sessions by st.cache_resource), so chat turns reuse an
+# open keep-alive connection to the backend instead of opening a new one.
+# Failed connection attempts are retried twice before giving up. A dead
+# backend is detected after 3 s and a stalled reply after 20 s without
+# data, so the user gets an error (and a Retry button) instead of a
+# spinner that runs for minutes.
+# With the h2 package installed (httpx[http2]) and an https:// backend,
+# requests are multiplexed over HTTP/2 on a single connection; plain
+# http:// backends are always spoken to over HTTP/1.1.
+# Idle connections are kept for KEEPALIVE_SECONDS, longer than the usual
+# pause between two chat turns, so the next turn (and the first one,
+# after warm_backend) finds an open connection. Run uvicorn with a
+# longer --timeout-keep-alive (see README) so the server does not close
+# them first.
+@st.cache_resource
+def get_client():
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        print("[WARN] h2 not installed; backend requests use HTTP/1.1")
+        http2 = False
+    # (with a custom transport, the pool limits belong to the transport)
+    limits = httpx.Limits(
+        max_connections=16, max_keepalive_connections=8, keepalive_expiry=KEEPALIVE_SECONDS
+    )
+    return httpx.Client(
+        transport=httpx.HTTPTransport(http2=http2, retries=2, limits=limits),
+        timeout=httpx.Timeout(20, connect=3),
+    )
+
+
+# -------------------------------------------------------
+# Function: warm_backend
+# -------------------------------------------------------
+# Purpose:
+# Open a keep-alive connection to the backend when the app starts (once
+# per Streamlit server), so the first chat message does not pay for the
+# TCP (and TLS) handshake. A backend that is down is not an error here;
+# the chat turn reports it.
+@st.cache_resource
+def warm_backend():
+    try:
+        get_client().get(HEALTH_URL, timeout=2)
+    except httpx.HTTPError as e:
+        print(f"[WARN] Backend warm-up failed: {e}")
+    return True
+
+
+# -------------------------------------------------------
+# Function: stream_events
+# -------------------------------------------------------
+# Purpose:
+# Calls the backend's streaming endpoint and yields its Server-Sent
+# Events as (event, data) pairs: "token" events carry pieces of the
+# reply, the final "done" event the full response (sections, follow-up).
+# An "open" event is yielded first, once the backend has answered.
+def stream_events(client, payload):
+    # The payload is encoded with orjson (faster than httpx's json= encoder)
+    # and compressed when it is large (e.g. a long message)
+    body = orjson.dumps(payload)
+    headers = {"Accept": "text/event-stream", "Content-Type": "application/json"}
+    if len(body) > GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    with client.stream("POST", STREAM_URL, content=body, headers=headers) as r:
+        r.raise_for_status()
+        yield "open", None  # the backend accepted the request
+        event = None
+        for line in r.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                yield event, orjson.loads(line[len("data: "):])
+
+
+# -------------------------------------------------------
+# Background replies
+# -------------------------------------------------------
+# The backend call runs in a worker thread, not in the script run: the
+# thread collects the reply into a "job" dict kept in st.session_state,
+# and the chat panel only displays it. When a run is interrupted (e.g.
+# by sending another message), the reply keeps arriving and the next run
+# picks it up where it left off instead of losing it.
+@st.cache_resource
+def get_pool():
+    return ThreadPoolExecutor(max_workers=REPLY_WORKERS)
+
+def fetch_reply(client, payload, job):
+    for event, data in stream_events(client, payload):
+        if event == "token":
+            job["phase"] = "writing"
+            job["tokens"].append(data["text"])
+        elif event == "open":
+            job["phase"] = "waiting"
+        elif event == "done":
+            job["data"] = data
+        elif event == "error":
+            raise RuntimeError(data.get("detail"))
+
+def start_reply(turn, payload):
+    job = {"turn": turn, "payload": payload, "tokens": [], "data": None, "phase": "connecting"}
+    job["future"] = get_pool().submit(fetch_reply, get_client(), payload, job)
+    return job
+
+# Progress labels shown (in an st.status) for each phase of a job
+PHASE_LABELS = {
+    "connecting": "Contacting Holos backend…",
+    "waiting": "Looking up documents, data and weather…",
+    "writing": "Writing reply…",
+}
+
+# Yields the reply text of a job as it arrives, for st.write_stream, and
+# keeps the status label in step with the job's phase
+# (re-raises the job's error, if any, once it is finished)
+def follow_reply(job, status):
+    seen, phase = 0, None
+    while True:
+        if job["phase"] != phase:
+            phase = job["phase"]
+            status.update(label=PHASE_LABELS[phase])
+        done = job["future"].done()
+        tokens = job["tokens"]
+        if len(tokens) > seen:
+            yield "".join(tokens[seen:])
+            seen = len(tokens)
+        elif done:
+            break
+        else:
+            time.sleep(0.05)
+    job["future"].result()
+
+
 # -------------------------------------------------------
 # Streamlit Page Setup
 # -------------------------------------------------------
 st.set_page_config(page_title="Holos Agri Assistant", page_icon="🌾")
+warm_backend()
 
 
 # -------------------------------------------------------
@@ -124,11 +293,12 @@ st.set_page_config(page_title="Holos Agri Assistant", page_icon="🌾")
 #         </div>
 #     """, unsafe_allow_html=True)
 
-#     # Streamlit button logic handled outside HTML form
-#     chat = st.button("Start Chat", key="chat_button")
-#     if chat:
+#     # Streamlit button logic handled outside HTML form. The callback sets
+#     # the page flag before the rerun the click already triggers, so no
+#     # extra st.rerun() is needed.
+#     def start_chat():
 #         st.session_state.page = "chatbot"
-#         st.rerun()
+#     st.button("Start Chat", key="chat_button", on_click=start_chat)
 
 #     st.stop()
 
@@ -149,8 +319,6 @@ st.title("Holos Agri Assistant 🌾")
     # Create a unique session ID and store conversation context across interactions.
 if "session_id" not in st.session_state:
     st.session_state.session_id = "demo-session"
-if "context" not in st.session_state:
-    st.session_state.context = {}
 if "messages" not in st.session_state:
         st.session_state.messages = []
 
@@ -158,85 +326,200 @@ if "messages" not in st.session_state:
     # -------------------------------------------------------
     # Sidebar: Context Input
     # -------------------------------------------------------
-with st.sidebar:
+    # The widgets keep their values in st.session_state (ctx_crop,
+    # ctx_region) themselves; they are read when a message is sent.
+    # The panel is a Streamlit fragment, so editing the context reruns
+    # only the sidebar and the chat is not repainted.
+    # (st.fragment is called st.experimental_fragment before Streamlit 1.37)
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+# Context edit callback: a sidebar-only rerun stops a reply that is
+# still being drawn (it keeps arriving in the background), so ask for
+# a full rerun to show it again
+def context_changed():
+    if st.session_state.get("job"):
+        st.session_state.resume_reply = True
+
+@fragment
+def context_panel():
     st.header("Context")
-    st.session_state.context["crop"] = st.text_input(
-        "Crop", st.session_state.context.get("crop", "")
-    )
-    st.session_state.context["region"] = st.text_input(
-        "Region/County/ZIP", st.session_state.context.get("region", "")
-    )
+    st.text_input("Crop", key="ctx_crop", on_change=context_changed)
+    st.text_input("Region/County/ZIP", key="ctx_region", on_change=context_changed)
+    if st.session_state.pop("resume_reply", False):
+        st.rerun()
+
+with st.sidebar:
+    context_panel()
 
 # -------------------------------------------------------
-# Chat Input Box
+# Function: add_reply
 # -------------------------------------------------------
-# The main text box for user messages at the bottom of the app.
-user_input = st.chat_input("Ask about planting windows, yield, irrigation, etc.")
+# Purpose:
+# Add the assistant reply to the chat history, keeping the history (and
+# the stored replies) of the session bounded.
+def add_reply(turn, reply):
+    st.session_state.messages.append({"role": "assistant", "content": reply})
+    del st.session_state.messages[:-MAX_MESSAGES]
+    replies = st.session_state.replies
+    for old_turn in [t for t in replies if t <= turn - MAX_MESSAGES // 2]:
+        del replies[old_turn]
+
 
 # -------------------------------------------------------
-# When user submits a message
+# Function: show_reply
 # -------------------------------------------------------
-if user_input:
-    with st.spinner("Thinking..."):
-        # Prepare the payload to send to the FastAPI backend
-        payload = {
-            "session_id": st.session_state.session_id,
-            "message": user_input,
-            "context": st.session_state.context,
-        }
-
-        # Try to send the message to the backend API
+# Purpose:
+# Show the reply of a background job word by word as it arrives, then
+# record it (history, per-turn replies).
+def show_reply(job):
+    turn, payload = job["turn"], job["payload"]
+    with st.chat_message("assistant"):
+        status = st.status(PHASE_LABELS[job["phase"]], expanded=False)
         try:
-            r = requests.post(API_URL, json=payload, timeout=120)
-            r.raise_for_status()  # Raise error if the request failed
-            
-            # Parse the response JSON from backend
-            data = r.json()
-            
-            # Save the last response in session memory
-            st.session_state.last_response = data
-        except requests.exceptions.ConnectionError:
-            st.error("⚠️ Unable to connect to the backend server. Please make sure the backend server is running on port 8001.")
-            st.info("To start the backend server, open a new terminal and run: `uvicorn holos.api:app --port 8001`")
-            st.session_state.last_response = None
+            reply = st.write_stream(follow_reply(job, status)) or "⚠️ No reply received."
+            status.update(label="Answered", state="complete")
+            st.session_state.last_response = job["data"]
+            st.session_state.replies[turn] = reply
+        except httpx.ConnectError:
+            reply = "⚠️ Backend not reachable. Run: `uvicorn holos.api:app --port 8001 --timeout-keep-alive 300`"
+            st.markdown(reply)
+        except httpx.TimeoutException:
+            reply = "⚠️ The backend took too long to answer. Press Retry to send the message again."
+            st.markdown(reply)
+            st.session_state.retry_payload = (turn, payload)
         except Exception as e:
-            st.error(f"⚠️ An error occurred: {str(e)}")
-            st.session_state.last_response = None
+            reply = f"⚠️ Error: {e}"
+            st.markdown(reply)
+        if st.session_state.replies.get(turn) is None:  # only stored when it arrived
+            status.update(label="No reply", state="error")
+
+    del st.session_state.job
+    add_reply(turn, reply)
+
+
+# -------------------------------------------------------
+# Function: show_all_messages
+# -------------------------------------------------------
+# Purpose:
+# "Show earlier messages" button callback: draw the whole history.
+def show_all_messages():
+    st.session_state.show_all = True
+
+
+# -------------------------------------------------------
+# Function: retry_last
+# -------------------------------------------------------
+# Purpose:
+# Retry button callback: queue the timed-out payload to be sent again.
+def retry_last():
+    st.session_state.resend = st.session_state.pop("retry_payload", None)
+
 
 # -------------------------------------------------------
-# Display Chatbot Response
+# Function: submit_message
 # -------------------------------------------------------
-# --- Display existing chat history (like ChatGPT) ---
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+# Purpose:
+# Chat box callback: hand the submitted text to the chat panel.
+# Blank submissions (a stray Enter) are ignored without calling the
+# backend, and long messages are cut to MAX_INPUT_CHARS.
+def submit_message():
+    text = (st.session_state.chat_box or "").strip()[:MAX_INPUT_CHARS]
+    if text:
+        st.session_state.new_message = text
 
-# --- Handle new user input ---
-if user_input:
-    # Show user message instantly on right
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    with st.chat_message("user"):
-        st.markdown(user_input)
 
-    with st.spinner("Thinking..."):
+# -------------------------------------------------------
+# Function: chat_panel
+# -------------------------------------------------------
+# Purpose:
+# Chat history, new message and backend call, run as a Streamlit
+# fragment: its own buttons (Retry, Show earlier messages) rerun only
+# this panel. The chat box itself stays outside the fragment, so
+# Streamlit keeps it pinned to the bottom of the page.
+@fragment
+def chat_panel():
+    # Message submitted in the chat box (see submit_message), if any
+    user_input = st.session_state.pop("new_message", None)
+
+    # -------------------------------------------------------
+    # Display Chatbot Response
+    # -------------------------------------------------------
+    # --- Display existing chat history (like ChatGPT) ---
+    # Streamlit redraws every message on every run, so only the last
+    # HISTORY_SHOWN are drawn until "Show earlier messages" is pressed;
+    # a long conversation then costs the same per run as a short one.
+    messages = st.session_state.messages
+    start = 0 if st.session_state.get("show_all") else max(0, len(messages) - HISTORY_SHOWN)
+    if start:
+        st.button(f"Show {start} earlier messages", on_click=show_all_messages)
+    for msg in messages[start:]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+    # --- Reply still in progress ---
+    # Started by an earlier run that was interrupted before it was done
+    replies = st.session_state.setdefault("replies", {})
+    if st.session_state.get("job"):
+        show_reply(st.session_state.job)
+
+    # --- Handle new user input ---
+    # Every submitted message gets a new turn id. A submission is handled
+    # once (new_message is removed from the session state when read),
+    # and answered turns keep their reply under the turn id, so a stale
+    # Retry for a turn that was already answered shows the stored reply
+    # instead of calling the API again.
+    payload, turn = None, None
+    if user_input:
+        turn = st.session_state.turn_id = st.session_state.get("turn_id", 0) + 1
+
+        # Show user message instantly on right
+        st.session_state.messages.append({"role": "user", "content": user_input})
+        with st.chat_message("user"):
+            st.markdown(user_input)
+
         payload = {
             "session_id": st.session_state.session_id,
             "message": user_input,
-            "context": st.session_state.context,
+            "context": {
+                "crop": st.session_state.ctx_crop,
+                "region": st.session_state.ctx_region,
+            },
         }
-        try:
-            r = requests.post(API_URL, json=payload, timeout=120)
-            r.raise_for_status()
-            data = r.json()
-            reply = data.get("reply", "⚠️ No reply received.")
-        except requests.exceptions.ConnectionError:
-            reply = "⚠️ Backend not reachable. Run: `uvicorn holos.api:app --port 8001`"
-        except Exception as e:
-            reply = f"⚠️ Error: {e}"
-
-    # Add assistant reply on left
-    st.session_state.messages.append({"role": "assistant", "content": reply})
-    with st.chat_message("assistant"):
-        st.markdown(reply)
-
+        st.session_state.pop("retry_payload", None)
+
+    # --- Retry a timed-out message ---
+    # Set by the Retry button's callback (see below) before this rerun
+    elif st.session_state.get("resend"):
+        turn, payload = st.session_state.pop("resend")
+
+    if payload and turn in replies:
+        with st.chat_message("assistant"):
+            st.markdown(replies[turn])
+    elif payload:
+        # The reply is fetched in the background and shown word by word as
+        # it is generated. The backend may answer from its response cache,
+        # which is keyed by the message, the merged context (the full
+        # sidebar context is always sent) and this session's recent
+        # history, so a cached reply never comes from another
+        # conversation. The final stream event also keeps the full
+        # response in st.session_state.last_response.
+        st.session_state.job = start_reply(turn, payload)
+        show_reply(st.session_state.job)
+
+    # --- Retry button ---
+    # The payload of a turn that timed out is kept, so the button re-sends it
+    # without the user typing the message again.
+    if st.session_state.get("retry_payload"):
+        st.button("↻ Retry", on_click=retry_last)
+
+
+chat_panel()
 
+# -------------------------------------------------------
+# Chat Input Box
+# -------------------------------------------------------
+# The main text box for user messages at the bottom of the app.
+st.chat_input(
+    "Ask about planting windows, yield, irrigation, etc.",
+    key="chat_box", max_chars=MAX_INPUT_CHARS, on_submit=submit_message,
+)